@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: awx_inventory_export
+short_description: Export AWX deployment inventories to an indexed JSON file
+description:
+   - Exports every deployment inventory (inventories whose variables define
+     C(deployment_owner)) with its groups, group variables and hosts into one
+     JSON file indexed by owner.
+   - Refreshes only download inventories, groups or hosts modified since the
+     newest modification time recorded by the previous export, or whose host
+     or group count changed (deletions), instead of repeating the
+     C(variables__contains) search.
+options:
+  dest:
+    description:
+    - JSON file receiving the export
+    required: yes
+    type: path
+  force:
+    description:
+    - Ignore the previous export and download everything
+    type: bool
+    default: no
+'''
+
+EXAMPLES = r'''
+- name: Refresh the deployment inventory export
+  awx_inventory_export:
+    dest: /tmp/awx_deployments.json
+    provider: "{{ awx_provider }}"
+  connection: local
+
+- name: Inventories of one owner
+  debug:
+    msg: "{{ (lookup('file', '/tmp/awx_deployments.json') | from_json).owners['jdoe'] }}"
+'''
+
+RETURN = r'''
+refreshed:
+  description: Ids of the inventories downloaded by this run
+  returned: always
+  type: list
+removed:
+  description: Ids of the inventories dropped from the export
+  returned: always
+  type: list
+unowned:
+  description: Names of the exported inventories left out of the owner index
+    because their deployment_owner is empty
+  returned: always
+  type: list
+total:
+  description: Number of inventories in the export
+  returned: always
+  type: int
+'''
+
+import json
+import os
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.awx.api import AwxApiModule, AWX_FILTER_CHUNK, chunks, parse_variables
+
+
+def newest(*timestamps):
+    ''' AWX timestamps are ISO 8601 in UTC, so they sort as strings '''
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    return max(timestamps) if timestamps else None
+
+
+def in_filter(ids):
+    return ','.join(str(id) for id in ids)
+
+
+def export_inventories(awx_module, inventories):
+    ''' Builds the export entries of the given inventories with bulk
+    group and host queries
+    '''
+    exported = {}
+    watermark = None
+    for inventory in inventories:
+        variables = parse_variables(inventory.get('variables')) or {}
+        exported[str(inventory['id'])] = dict(
+            name=inventory['name'],
+            owner=variables.get('deployment_owner'),
+            modified=inventory.get('modified'),
+            total_hosts=inventory.get('total_hosts'),
+            total_groups=inventory.get('total_groups'),
+            variables=variables,
+            groups={}
+        )
+        watermark = newest(watermark, inventory.get('modified'))
+    group_names = {}
+    for ids in chunks([inventory['id'] for inventory in inventories], AWX_FILTER_CHUNK):
+        for group in awx_module.paginate('groups/', dict(inventory__in=in_filter(ids))):
+            group_vars = parse_variables(group.get('variables'))
+            if group_vars is None:
+                group_vars = awx_module.get_inventory_group_vars(group['id'])
+            exported[str(group['inventory'])]['groups'][group['name']] = dict(vars=group_vars or {}, hosts=[])
+            group_names[group['id']] = (str(group['inventory']), group['name'])
+            watermark = newest(watermark, group.get('modified'))
+        for host in awx_module.paginate('hosts/', dict(inventory__in=in_filter(ids))):
+            host_groups = host.get('summary_fields', {}).get('groups', {})
+            group_ids = [group['id'] for group in host_groups.get('results', [])]
+            if host_groups.get('count', 0) > len(group_ids):
+                # summary_fields only embeds the first few groups of a host
+                group_ids = [group['id'] for group in awx_module.paginate('hosts/{}/groups/'.format(host['id']))]
+            for group_id in group_ids:
+                if group_id in group_names:
+                    inventory_id, group_name = group_names[group_id]
+                    exported[inventory_id]['groups'][group_name]['hosts'].append(host['name'])
+            watermark = newest(watermark, host.get('modified'))
+    return exported, watermark
+
+
+def main():
+    argument_spec = dict(
+        dest=dict(type='path', required=True),
+        force=dict(type='bool', default=False),
+    )
+    argument_spec.update(AwxApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+    )
+
+    awx_module = AwxApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        refreshed=[],
+        removed=[],
+        unowned=[],
+        total=0,
+    )
+
+    dest = module.params['dest']
+    export = dict(exported_at=None, inventories={}, owners={})
+    if os.path.exists(dest) and not module.params['force']:
+        with open(dest) as export_file:
+            export = json.load(export_file)
+    since = export.get('exported_at')
+    known = export['inventories']
+
+    # =========================================================================
+    # Find the inventories to download
+    if not since:
+        candidates = list(awx_module.paginate('inventories/', dict(variables__contains="'deployment_owner'")))
+    else:
+        candidates = list(awx_module.paginate('inventories/', dict(modified__gt=since)))
+        modified_ids = set(inventory['id'] for inventory in candidates)
+        # inventories whose groups or hosts changed, the inventory itself may not
+        stale = set()
+        for kind in ('groups/', 'hosts/'):
+            for obj in awx_module.paginate(kind, dict(modified__gt=since)):
+                if str(obj['inventory']) in known and obj['inventory'] not in modified_ids:
+                    stale.add(obj['inventory'])
+        existing = set()
+        for ids in chunks([int(id) for id in known], AWX_FILTER_CHUNK):
+            for inventory in awx_module.paginate('inventories/', dict(id__in=in_filter(ids))):
+                existing.add(str(inventory['id']))
+                if inventory['id'] in modified_ids:
+                    continue
+                # deleting a host or group bumps no surviving object's
+                # modified time, only the inventory's counts show it
+                previous = known[str(inventory['id'])]
+                if inventory['id'] in stale or \
+                        (previous.get('total_hosts'), previous.get('total_groups')) != \
+                        (inventory.get('total_hosts'), inventory.get('total_groups')):
+                    candidates.append(inventory)
+        result['removed'] = [id for id in known if id not in existing]
+        for id in result['removed']:
+            del known[id]
+    qualified = []
+    for inventory in candidates:
+        previous = known.pop(str(inventory['id']), None)
+        if 'deployment_owner' in (parse_variables(inventory.get('variables')) or {}):
+            qualified.append(inventory)
+        elif previous is not None:
+            result['removed'].append(str(inventory['id']))
+    result['removed'] = sorted(result['removed'])
+
+    # =========================================================================
+    # Download changed inventories and rebuild the owner index
+    exported, watermark = export_inventories(awx_module, qualified)
+    known.update(exported)
+    result['refreshed'] = sorted(exported)
+    export['exported_at'] = newest(since, watermark)
+    export['owners'] = {}
+    for id, inventory in known.items():
+        if inventory['owner']:
+            export['owners'].setdefault(inventory['owner'], []).append(inventory['name'])
+        else:
+            # deployment_owner is defined but empty, there is no owner to index
+            result['unowned'].append(inventory['name'])
+    result['unowned'] = sorted(result['unowned'])
+    result['total'] = len(known)
+    result['changed'] = bool(result['refreshed'] or result['removed'])
+
+    if result['changed'] and not module.check_mode:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)))
+        with os.fdopen(fd, 'w') as export_file:
+            json.dump(export, export_file)
+        os.rename(tmp_path, dest)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
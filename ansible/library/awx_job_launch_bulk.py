@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: awx_job_launch_bulk
+short_description: Launch an AWX job template across many inventories
+description:
+   - Launches one job template once per inventory or extra_vars set, keeping
+     the number of jobs in flight within the free capacity of the instance
+     groups of the template and starting queued launches as running ones finish.
+   - Returns a summary with the status and duration of every launch.
+options:
+  template:
+    description:
+    - Name of the job template to launch
+    required: yes
+  inventories:
+    description:
+    - Inventory names, one launch per inventory
+    required: no
+    type: list
+  extra_vars_list:
+    description:
+    - Extra vars sets, one launch per set. When used with I(inventories) both
+      lists must have the same length and are paired by position.
+    required: no
+    type: list
+  extra_vars:
+    description:
+    - Extra vars merged into every launch
+    required: no
+    type: dict
+  credentials:
+    description:
+    - Credential names used by every launch
+    required: no
+    type: list
+  max_concurrency:
+    description:
+    - Upper bound of jobs in flight. When 0 the bound is derived from the free
+      capacity of the instance groups of the template (all instance groups
+      when the template has none, which overestimates it when the
+      inventories or organization are bound to groups) and the forks of
+      the template.
+    type: int
+    default: 0
+  timeout:
+    description:
+    - Seconds to wait for all launches to finish
+    type: int
+    default: 3600
+  fail_on_error:
+    description:
+    - Fail the task when a launch does not end successfully
+    type: bool
+    default: yes
+'''
+
+EXAMPLES = r'''
+- name: Build fifty siwapp pods
+  awx_job_launch_bulk:
+    template: Deploy Siwapp Pod
+    inventories: "{{ range(1, 51) | map('regex_replace', '^', 'siwapp-pod-') | list }}"
+    credentials:
+    - AWS Lab
+    provider: "{{ awx_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+launches:
+  description: One entry per launch with its inventory, job id, status,
+    duration in seconds and, for launches AWX refused, the error
+  returned: always
+  type: list
+max_in_flight:
+  description: Number of jobs allowed in flight
+  returned: always
+  type: int
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.awx.api import AwxApiModule, launch_summary
+
+
+def main():
+    argument_spec = dict(
+        template=dict(type='str', required=True),
+        inventories=dict(type='list', required=False),
+        extra_vars_list=dict(type='list', required=False),
+        extra_vars=dict(type='dict', required=False),
+        credentials=dict(type='list', required=False),
+        max_concurrency=dict(type='int', default=0),
+        timeout=dict(type='int', default=3600),
+        fail_on_error=dict(type='bool', default=True),
+    )
+    argument_spec.update(AwxApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[['inventories', 'extra_vars_list']],
+        supports_check_mode=True,
+    )
+
+    awx_module = AwxApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        launches=[],
+        max_in_flight=0,
+    )
+
+    inventories = module.params['inventories']
+    extra_vars_list = module.params['extra_vars_list']
+    if inventories and extra_vars_list and len(inventories) != len(extra_vars_list):
+        module.fail_json(msg='inventories and extra_vars_list must have the same length')
+    count = len(inventories or extra_vars_list)
+    launches = []
+    for index in range(count):
+        extra_vars = dict(module.params['extra_vars'] or {})
+        if extra_vars_list:
+            extra_vars.update(extra_vars_list[index])
+        launches.append(dict(
+            inventory=inventories[index] if inventories else None,
+            credentials=module.params['credentials'],
+            extra_vars=extra_vars or None
+        ))
+
+    # =========================================================================
+    # Size the number of jobs in flight to the free capacity
+    template_id = awx_module.resolve_id('job_templates', module.params['template'])
+    resp = awx_module.session.get(awx_module.uri + 'job_templates/{}/'.format(template_id))
+    if resp.status_code != 200:
+        awx_module.handle_exception('get', resp)
+    # a job consumes one unit per fork plus one for the job itself
+    impact = (resp.json().get('forks') or 5) + 1
+    max_in_flight = max(1, awx_module.get_free_capacity(template_id) // impact)
+    if module.params['max_concurrency']:
+        max_in_flight = min(max_in_flight, module.params['max_concurrency'])
+    result['max_in_flight'] = max_in_flight
+
+    if module.check_mode:
+        result['launches'] = [launch_summary(launch) for launch in launches]
+        result['changed'] = bool(launches)
+        module.exit_json(**result)
+
+    result['launches'] = awx_module.launch_jobs(
+        module.params['template'], launches, max_in_flight, module.params['timeout'])
+    result['changed'] = True
+    unsuccessful = [launch for launch in result['launches'] if launch['status'] != 'successful']
+    if unsuccessful and module.params['fail_on_error']:
+        module.fail_json(msg='%d of %d launches did not succeed' % (len(unsuccessful), count), **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_application_export
+short_description: Stream records of a Tetration application export to a file
+description:
+   - Streams policies, clusters or cluster members out of an application's
+     policy and ADM export and writes them as JSON lines, keeping only the
+     selected fields. The export is parsed incrementally when ijson is
+     installed, so memory use does not grow with the workspace.
+requirements:
+    - tetpyclient
+    - ijson (recommended)
+extends_documentation_fragment: tetration
+options:
+  application_id:
+    description:
+    - ID of the application to export
+    required: yes
+  version:
+    description:
+    - Version of the application to export, the latest when omitted
+    required: no
+  record:
+    description:
+    - Kind of record to extract
+    choices: [ default_policies, absolute_policies, inventory_filters, clusters, members ]
+    default: default_policies
+  fields:
+    description:
+    - Fields to keep from every record, dotted for nested fields
+    required: no
+    type: list
+  dest:
+    description:
+    - JSON lines file receiving the records
+    required: yes
+    type: path
+'''
+
+EXAMPLES = r'''
+- name: Extract the ADM cluster members of the siwapp workspace
+  tetration_application_export:
+    application_id: 5c93da83497d4f33d9f6c2fe
+    record: members
+    fields:
+    - ip
+    - name
+    dest: /tmp/siwapp_members.jsonl
+    provider: "{{ tetration_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+count:
+  description: Number of records written
+  returned: always
+  type: int
+'''
+
+import json
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.tetration.api import TetrationApiModule, TETRATION_EXPORT_RECORDS
+
+
+def main():
+    argument_spec = dict(
+        application_id=dict(type='str', required=True),
+        version=dict(type='str', required=False),
+        record=dict(type='str', default='default_policies', choices=sorted(TETRATION_EXPORT_RECORDS.keys())),
+        fields=dict(type='list', required=False),
+        dest=dict(type='path', required=True),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=False,
+    )
+
+    tet_module = TetrationApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=True,
+        count=0,
+    )
+
+    records = tet_module.iter_application(
+        module.params['application_id'],
+        record=module.params['record'],
+        fields=module.params['fields'],
+        version=module.params['version']
+    )
+    with open(module.params['dest'], 'w') as dest:
+        for record in records:
+            dest.write(json.dumps(record) + '\n')
+            result['count'] += 1
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
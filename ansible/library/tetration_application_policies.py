@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_application_policies
+short_description: Push a policy matrix to a Tetration application as one version
+description:
+   - Compiles a compact policy matrix of consumer, provider, protocol and ports
+     into the minimal set of policies, merging overlapping port ranges, and
+     imports them as a single new version of the application.
+   - Nothing is pushed when the compiled policies match the current version.
+requirements:
+    - tetpyclient
+extends_documentation_fragment: tetration
+options:
+  application_id:
+    description:
+    - ID of the application receiving the policies
+    required: no
+  application_name:
+    description:
+    - Name of the application receiving the policies
+    required: no
+  matrix:
+    description:
+    - List of rows with C(consumer), C(provider), C(protocol), C(ports) and an
+      optional C(action) (ALLOW or DENY). Consumers and providers are inventory
+      filter names, full scope names or filter ids. C(protocol) is required,
+      use C(ANY) to allow every protocol.
+    required: no
+    type: list
+  matrix_file:
+    description:
+    - CSV or YAML file holding the same rows as I(matrix)
+    required: no
+    type: path
+  absolute:
+    description:
+    - Push the policies as absolute rather than default policies
+    type: bool
+    default: no
+  catch_all_action:
+    description:
+    - Action applied to traffic not matched by any policy
+    choices: [ ALLOW, DENY ]
+    default: DENY
+'''
+
+EXAMPLES = r'''
+- name: Push the siwapp pod policies
+  tetration_application_policies:
+    application_name: Siwapp Pod12
+    matrix:
+    - consumer: Default:Siwapp:Pod12:App
+      provider: Default:Siwapp:Pod12:Db
+      protocol: TCP
+      ports: 3306,4444,4567-4568
+    - consumer: Default:Siwapp:Pod12
+      provider: Default:Siwapp:Pod12
+      protocol: ICMP
+    provider: "{{ tetration_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+object:
+  description: Compiled policies
+  returned: always
+  type: list
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.tetration.api import TetrationApiModule, TETRATION_API_APPLICATIONS
+from ansible.module_utils.tetration.policy_compiler import compile_policies, load_matrix, normalize_policies
+
+
+def main():
+    argument_spec = dict(
+        application_id=dict(type='str', required=False),
+        application_name=dict(type='str', required=False),
+        matrix=dict(type='list', required=False),
+        matrix_file=dict(type='path', required=False),
+        absolute=dict(type='bool', default=False),
+        catch_all_action=dict(type='str', default='DENY', choices=['ALLOW', 'DENY']),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[['application_id', 'application_name'], ['matrix', 'matrix_file']],
+        mutually_exclusive=[['application_id', 'application_name'], ['matrix', 'matrix_file']],
+        supports_check_mode=True,
+    )
+
+    tet_module = TetrationApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        object=None,
+    )
+
+    # =========================================================================
+    # Resolve the application and compile the matrix
+    application_id = module.params['application_id']
+    if not application_id:
+        application = tet_module.get_object(
+            target=TETRATION_API_APPLICATIONS,
+            filter=dict(name=module.params['application_name']),
+            params=dict()
+        )
+        if not application:
+            module.fail_json(msg='Unable to find application: %s' % module.params['application_name'])
+        application_id = application['id']
+
+    filter_ids = tet_module.get_filter_ids()
+    known_ids = set(filter_ids.values())
+
+    def resolve_filter(name):
+        if name in filter_ids:
+            return filter_ids[name]
+        if name in known_ids:
+            return name
+        raise ValueError('unknown inventory filter or scope: %s' % name)
+
+    try:
+        rows = module.params['matrix'] or load_matrix(module.params['matrix_file'])
+        policies = compile_policies(rows, resolve_filter)
+    except (ValueError, KeyError) as exc:
+        module.fail_json(msg='Invalid policy matrix: %s' % exc)
+    result['object'] = policies
+
+    # =========================================================================
+    # Import a new version only when the policies differ
+    policy_key = 'absolute_policies' if module.params['absolute'] else 'default_policies'
+    current = tet_module.export_application(application_id) or dict()
+    if normalize_policies(current.get(policy_key) or []) == normalize_policies(policies) \
+            and current.get('catch_all_action', module.params['catch_all_action']) == module.params['catch_all_action']:
+        module.exit_json(**result)
+
+    result['changed'] = True
+    if not module.check_mode:
+        req_payload = dict(
+            catch_all_action=module.params['catch_all_action'],
+            absolute_policies=current.get('absolute_policies') or [],
+            default_policies=current.get('default_policies') or [],
+            clusters=current.get('clusters') or [],
+            inventory_filters=current.get('inventory_filters') or []
+        )
+        req_payload[policy_key] = policies
+        tet_module.import_application(application_id, req_payload)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_config_intents
+short_description: Set the complete ordered list of Tetration config intents
+description:
+   - Takes the complete desired ordered list of agent config intents or
+     interface config intents and diffs it against the current list by
+     inventory filter and profile or VRF ids.
+   - Agent config intents are reordered with a single order update, creating
+     only the missing intents. Interface config intents are replaced with a
+     single request. Nothing is sent when the lists already match.
+requirements:
+    - tetpyclient
+extends_documentation_fragment: tetration
+options:
+  intent_type:
+    description:
+    - Kind of intents managed
+    choices: [ agent, interface ]
+    default: agent
+  intents:
+    description:
+    - Desired ordered list. Every entry has an C(inventory_filter) and, for
+      agent intents, a C(profile) or, for interface intents, a C(vrf). Each
+      may be given by name or id.
+    required: yes
+    type: list
+  purge:
+    description:
+    - Delete agent config intents that are not in I(intents). When disabled
+      they are kept after the listed intents in their current order.
+    type: bool
+    default: yes
+'''
+
+EXAMPLES = r'''
+- name: Apply agent profiles to the pod filters in priority order
+  tetration_config_intents:
+    intent_type: agent
+    intents:
+    - inventory_filter: Siwapp Pod12 Db
+      profile: Enforcement Enabled
+    - inventory_filter: Siwapp Pod12
+      profile: Visibility Only
+    provider: "{{ tetration_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+object:
+  description: Resulting ordered list of intent ids (agent) or intents (interface).
+    In check mode, intents that would be created appear as
+    C(new:<inventory_filter_id>:<profile_id>).
+  returned: always
+  type: list
+created:
+  description: Number of agent config intents created
+  returned: always
+  type: int
+deleted:
+  description: Number of agent config intents deleted
+  returned: always
+  type: int
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.tetration.api import TetrationApiModule
+from ansible.module_utils.tetration.api import TETRATION_API_AGENT_CONFIG_INTENTS
+from ansible.module_utils.tetration.api import TETRATION_API_AGENT_CONFIG_ORDERS
+from ansible.module_utils.tetration.api import TETRATION_API_AGENT_CONFIG_PROFILES
+from ansible.module_utils.tetration.api import TETRATION_API_INTERFACE_INTENTS
+from ansible.module_utils.tetration.api import TETRATION_API_INVENTORY_FILTER
+from ansible.module_utils.tetration.api import TETRATION_API_TENANT
+
+
+def name_map(tet_module, target):
+    ''' Maps names and ids of the objects under target to their ids '''
+    ids = {}
+    for obj in tet_module.get(target=target, params=None, req_payload=None) or []:
+        ids[obj['name']] = obj['id']
+        ids[obj['id']] = obj['id']
+    return ids
+
+
+def resolve(module, ids, value, kind):
+    if value not in ids:
+        module.fail_json(msg='Unable to find %s: %s' % (kind, value))
+    return ids[value]
+
+
+def main():
+    argument_spec = dict(
+        intent_type=dict(type='str', default='agent', choices=['agent', 'interface']),
+        intents=dict(type='list', required=True),
+        purge=dict(type='bool', default=True),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+    )
+
+    tet_module = TetrationApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        object=None,
+        created=0,
+        deleted=0,
+    )
+
+    filter_ids = name_map(tet_module, TETRATION_API_INVENTORY_FILTER)
+
+    # =========================================================================
+    # Interface intents are replaced wholesale
+    if module.params['intent_type'] == 'interface':
+        vrf_ids = name_map(tet_module, TETRATION_API_TENANT)
+        desired = [
+            dict(
+                inventory_filter_id=resolve(module, filter_ids, intent['inventory_filter'], 'inventory filter'),
+                vrf_id=resolve(module, vrf_ids, intent['vrf'], 'vrf')
+            ) for intent in module.params['intents']
+        ]
+        current = tet_module.get(target=TETRATION_API_INTERFACE_INTENTS, params=None, req_payload=None) or []
+        if isinstance(current, dict):
+            current = current.get('intents', [])
+        current_pairs = [(intent.get('inventory_filter_id'), intent.get('vrf_id')) for intent in current]
+        desired_pairs = [(intent['inventory_filter_id'], intent['vrf_id']) for intent in desired]
+        result['object'] = desired
+        if current_pairs != desired_pairs:
+            result['changed'] = True
+            if not module.check_mode:
+                tet_module.post(target=TETRATION_API_INTERFACE_INTENTS, params=None, req_payload=dict(intents=desired))
+        module.exit_json(**result)
+
+    # =========================================================================
+    # Agent intents: create missing ones, then submit one order update
+    profile_ids = name_map(tet_module, TETRATION_API_AGENT_CONFIG_PROFILES)
+    desired_pairs = [
+        (resolve(module, filter_ids, intent['inventory_filter'], 'inventory filter'),
+         resolve(module, profile_ids, intent['profile'], 'agent config profile'))
+        for intent in module.params['intents']
+    ]
+    intents = dict((intent['id'], intent) for intent in
+                   tet_module.get(target=TETRATION_API_AGENT_CONFIG_INTENTS, params=None, req_payload=None) or [])
+    order = tet_module.get(target=TETRATION_API_AGENT_CONFIG_ORDERS, params=None, req_payload=None) or {}
+    current_order = [intent_id for intent_id in order.get('intent_ids', []) if intent_id in intents]
+    current_order += [intent_id for intent_id in intents if intent_id not in current_order]
+
+    by_pair = {}
+    for intent_id in current_order:
+        intent = intents[intent_id]
+        by_pair.setdefault((intent['inventory_filter_id'], intent['inventory_config_profile_id']), intent_id)
+
+    new_order = []
+    for pair in desired_pairs:
+        intent_id = by_pair.pop(pair, None)
+        if not intent_id:
+            result['created'] += 1
+            result['changed'] = True
+            if module.check_mode:
+                # stands for the id the created intent would get
+                new_order.append('new:%s:%s' % pair)
+                continue
+            intent = tet_module.post(target=TETRATION_API_AGENT_CONFIG_INTENTS, params=None, req_payload=dict(
+                inventory_filter_id=pair[0],
+                inventory_config_profile_id=pair[1]
+            ))
+            intent_id = intent['id']
+        new_order.append(intent_id)
+    unlisted = [intent_id for intent_id in current_order if intent_id not in new_order]
+    if not module.params['purge']:
+        new_order += unlisted
+
+    if module.params['purge']:
+        for intent_id in unlisted:
+            result['deleted'] += 1
+            result['changed'] = True
+            if not module.check_mode:
+                tet_module.delete(target='%s/%s' % (TETRATION_API_AGENT_CONFIG_INTENTS, intent_id), params=None, req_payload=None)
+    if new_order != current_order:
+        result['changed'] = True
+        if not module.check_mode:
+            tet_module.post(target=TETRATION_API_AGENT_CONFIG_ORDERS, params=None, req_payload=dict(intent_ids=new_order))
+    result['object'] = new_order
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_filter_preview
+short_description: Preview Tetration inventory filters against a local inventory snapshot
+description:
+   - Compiles inventory filter queries into local predicates and evaluates
+     them over an inventory snapshot stored on the controller, so generated
+     filters can be validated before they are pushed to the cluster.
+   - The snapshot is only refreshed from the cluster when I(refresh=yes).
+requirements:
+    - tetpyclient (only when I(refresh) or I(fetch_filters) is set)
+extends_documentation_fragment: tetration
+options:
+  filters:
+    description:
+    - List of inventory filters to evaluate, each with a C(name) and a C(query)
+    required: no
+    type: list
+  fetch_filters:
+    description:
+    - Also evaluate every inventory filter currently defined on the cluster
+    type: bool
+    default: no
+  snapshot_path:
+    description:
+    - JSON file holding the inventory snapshot
+    required: yes
+    type: path
+  refresh:
+    description:
+    - Rebuild the snapshot from the inventory search API before evaluating
+    type: bool
+    default: no
+  scope_name:
+    description:
+    - Limit the refreshed snapshot to this scope
+    required: no
+  return_records:
+    description:
+    - Return the matching inventory records instead of their addresses only
+    type: bool
+    default: no
+'''
+
+EXAMPLES = r'''
+- name: Validate generated pod filters offline
+  tetration_filter_preview:
+    snapshot_path: /tmp/tetration_inventory.json
+    filters:
+    - name: Pod12 App
+      query:
+        type: and
+        filters:
+        - type: subnet
+          field: ip
+          value: 10.12.1.0/24
+        - type: eq
+          field: user_ansible_group
+          value: vm_tag_app
+  connection: local
+'''
+
+RETURN = r'''
+object:
+  description: Number of matches and matching addresses for each filter name
+  returned: always
+  type: dict
+errors:
+  description: Filters that could not be compiled, with the reason
+  returned: always
+  type: dict
+'''
+
+import json
+import os.path
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.tetration.api import TetrationApiModule, TETRATION_API_INVENTORY_FILTER
+from ansible.module_utils.tetration.filter_query import InventorySnapshot
+
+
+def main():
+    argument_spec = dict(
+        filters=dict(type='list', default=[]),
+        fetch_filters=dict(type='bool', default=False),
+        snapshot_path=dict(type='path', required=True),
+        refresh=dict(type='bool', default=False),
+        scope_name=dict(type='str', required=False),
+        return_records=dict(type='bool', default=False),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+    )
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        object=None,
+        errors=None,
+    )
+
+    snapshot_path = module.params['snapshot_path']
+    filters = list(module.params['filters'])
+    tet_module = None
+    if module.params['refresh'] or module.params['fetch_filters']:
+        tet_module = TetrationApiModule(module)
+
+    # =========================================================================
+    # Load or rebuild the inventory snapshot
+    if module.params['refresh']:
+        records = []
+        for page in tet_module.search_inventory(scope_name=module.params['scope_name']):
+            records.extend(page.get('results', []))
+        if not module.check_mode:
+            with open(snapshot_path, 'w') as snapshot_file:
+                json.dump(records, snapshot_file)
+            result['changed'] = True
+    elif not os.path.exists(snapshot_path):
+        module.fail_json(msg='Unable to find inventory snapshot: %s' % snapshot_path)
+    else:
+        with open(snapshot_path) as snapshot_file:
+            records = json.load(snapshot_file)
+    snapshot = InventorySnapshot(records)
+
+    if module.params['fetch_filters']:
+        filters.extend(tet_module.get(target=TETRATION_API_INVENTORY_FILTER, params=None, req_payload=None) or [])
+
+    # =========================================================================
+    # Evaluate every filter locally
+    matches, errors = snapshot.preview(filters)
+    result['object'] = dict()
+    for name, records in matches.items():
+        result['object'][name] = dict(
+            count=len(records),
+            ips=[record.get('ip') for record in records]
+        )
+        if module.params['return_records']:
+            result['object'][name]['records'] = InventorySnapshot(records).dump()
+    result['errors'] = errors
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
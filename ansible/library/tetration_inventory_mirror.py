@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_inventory_mirror
+short_description: Mirror the Tetration inventory into a local SQLite database
+description:
+   - Pages through the inventory search API and stores the hosts in a SQLite
+     database indexed on address, hostname, VRF and user annotations.
+   - Later runs sync incrementally, either by a timestamp field or by resuming
+     from the continuation offset the previous run stopped at.
+   - Incremental syncs only add and update hosts, they never remove hosts
+     that left the inventory. Run a C(full) sync periodically (e.g. nightly)
+     to drop them from the mirror.
+   - Use the C(tetration_inventory) lookup to query the mirror from playbooks.
+requirements:
+    - tetpyclient
+extends_documentation_fragment: tetration
+options:
+  database:
+    description:
+    - Path of the SQLite database
+    required: yes
+    type: path
+  sync_mode:
+    description:
+    - C(full) discards the mirror and reads the whole inventory.
+    - C(timestamp) only reads hosts whose I(timestamp_field) is newer than the
+      highest value seen by the previous complete sync. A sync stopped by
+      I(max_pages) resumes from its offset with the same filter.
+    - C(offset) resumes paging from the offset stored by the previous run,
+      so a large inventory can be mirrored over several runs with I(max_pages).
+    choices: [ full, timestamp, offset ]
+    default: timestamp
+  timestamp_field:
+    description:
+    - Numeric inventory field compared when I(sync_mode=timestamp)
+    required: no
+  query:
+    description:
+    - Inventory search filter limiting the mirrored hosts
+    required: no
+    type: dict
+  scope_name:
+    description:
+    - Limit the mirrored hosts to this scope
+    required: no
+  page_size:
+    description:
+    - Number of hosts requested per page
+    type: int
+    default: 1000
+  max_pages:
+    description:
+    - Stop after this many pages, 0 reads until the end of the inventory
+    type: int
+    default: 0
+'''
+
+EXAMPLES = r'''
+- name: Sync hosts updated since the last run
+  tetration_inventory_mirror:
+    database: /tmp/tetration_inventory.db
+    sync_mode: timestamp
+    timestamp_field: last_software_update_at
+    scope_name: Default:Siwapp
+    provider: "{{ tetration_provider }}"
+  connection: local
+
+- name: Read the address of the app tier from the mirror
+  debug:
+    msg: "{{ lookup('tetration_inventory', 'user_ansible_group=vm_tag_app', database='/tmp/tetration_inventory.db') }}"
+'''
+
+RETURN = r'''
+synced:
+  description: Number of hosts written by this run
+  returned: always
+  type: int
+total:
+  description: Number of hosts in the mirror after the sync
+  returned: always
+  type: int
+complete:
+  description: Whether the sync reached the end of the inventory
+  returned: always
+  type: bool
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.tetration.api import TetrationApiModule
+from ansible.module_utils.tetration.inventory_db import InventoryMirror
+
+
+def main():
+    argument_spec = dict(
+        database=dict(type='path', required=True),
+        sync_mode=dict(type='str', default='timestamp', choices=['full', 'timestamp', 'offset']),
+        timestamp_field=dict(type='str', required=False),
+        query=dict(type='dict', required=False),
+        scope_name=dict(type='str', required=False),
+        page_size=dict(type='int', default=1000),
+        max_pages=dict(type='int', default=0),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_if=[['sync_mode', 'timestamp', ['timestamp_field']]],
+        supports_check_mode=False,
+    )
+
+    tet_module = TetrationApiModule(module)
+    mirror = InventoryMirror(module.params['database'])
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        synced=0,
+        total=0,
+        complete=False,
+    )
+
+    sync_mode = module.params['sync_mode']
+    timestamp_field = module.params['timestamp_field']
+    query = module.params['query']
+    offset = None
+    last_timestamp = None
+    pending_timestamp = None
+
+    # =========================================================================
+    # Work out where the previous sync stopped
+    if sync_mode == 'full' or mirror.get_state('query') != [query, module.params['scope_name']]:
+        mirror.clear()
+        mirror.set_state('query', [query, module.params['scope_name']])
+    elif sync_mode == 'offset':
+        offset = mirror.get_state('offset')
+    elif sync_mode == 'timestamp':
+        last_timestamp = mirror.get_state('timestamp')
+        # results are not ordered by the timestamp, so the newest value is
+        # only safe to filter on once a sync read every page
+        pending_timestamp = mirror.get_state('pending_timestamp')
+        if pending_timestamp is not None:
+            offset = mirror.get_state('offset')
+        if last_timestamp is not None:
+            newer = dict(type='gt', field=timestamp_field, value=last_timestamp)
+            query = dict(type='and', filters=[query, newer]) if query else newer
+
+    # =========================================================================
+    # Page through the inventory, committing state after every page
+    pages = 0
+    result['complete'] = True
+    for page in tet_module.search_inventory(query=query, scope_name=module.params['scope_name'],
+                                            limit=module.params['page_size'], offset=offset):
+        records = page.get('results', [])
+        result['synced'] += mirror.upsert(records)
+        if timestamp_field and sync_mode != 'offset':
+            seen = [record[timestamp_field] for record in records if record.get(timestamp_field) is not None]
+            if seen:
+                pending_timestamp = max(seen + [timestamp for timestamp in (last_timestamp, pending_timestamp) if timestamp is not None])
+                mirror.set_state('pending_timestamp', pending_timestamp)
+        mirror.set_state('offset', page.get('offset'))
+        pages += 1
+        if module.params['max_pages'] and pages >= module.params['max_pages'] and page.get('offset'):
+            result['complete'] = False
+            break
+    if result['complete'] and pending_timestamp is not None:
+        mirror.set_state('timestamp', pending_timestamp)
+        mirror.set_state('pending_timestamp', None)
+
+    result['changed'] = result['synced'] > 0
+    result['total'] = mirror.count()
+    mirror.close()
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_sensor_delta
+short_description: Report Tetration sensor changes since the previous run
+description:
+   - Reads C(/sensors) once, stores a compact snapshot of every agent (version,
+     last check-in, interface addresses) on the controller and returns only
+     the agents that appeared, disappeared, were upgraded, changed addresses
+     or stopped or resumed reporting since the previous snapshot.
+requirements:
+    - tetpyclient
+extends_documentation_fragment: tetration
+options:
+  snapshot_path:
+    description:
+    - JSON file holding the snapshot of the previous run
+    required: yes
+    type: path
+  stale_after:
+    description:
+    - Seconds without a check-in after which an agent counts as not reporting
+    type: int
+    default: 900
+  page_size:
+    description:
+    - Number of sensors requested per page
+    type: int
+    default: 500
+'''
+
+EXAMPLES = r'''
+- name: Verify agents after the pod build
+  tetration_sensor_delta:
+    snapshot_path: /tmp/tetration_sensors.json
+    provider: "{{ tetration_provider }}"
+  register: sensors
+  connection: local
+
+- name: Fail when agents went silent
+  fail:
+    msg: "{{ sensors.stopped_reporting }}"
+  when: sensors.stopped_reporting | length > 0
+'''
+
+RETURN = r'''
+added:
+  description: Agents not present in the previous snapshot
+  returned: always
+  type: list
+removed:
+  description: Agents no longer returned by the cluster
+  returned: always
+  type: list
+upgraded:
+  description: Agents whose software version changed
+  returned: always
+  type: list
+interfaces_changed:
+  description: Agents whose interface addresses changed
+  returned: always
+  type: list
+stopped_reporting:
+  description: Agents that checked in recently last run but are stale now
+  returned: always
+  type: list
+resumed_reporting:
+  description: Agents that were stale last run but checked in since
+  returned: always
+  type: list
+total:
+  description: Number of agents in the new snapshot
+  returned: always
+  type: int
+'''
+
+import json
+import os
+import tempfile
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.tetration.api import TetrationApiModule, TETRATION_API_SENSORS
+
+DELTA_KEYS = ['added', 'removed', 'upgraded', 'interfaces_changed', 'stopped_reporting', 'resumed_reporting']
+
+
+def compact(sensor):
+    ''' Keeps the fields the delta is computed from '''
+    return dict(
+        host_name=sensor.get('host_name'),
+        version=sensor.get('current_sw_version'),
+        last_check_in=sensor.get('last_config_fetch_at'),
+        ips=sorted(set(interface['ip'] for interface in sensor.get('interfaces') or [] if interface.get('ip')))
+    )
+
+
+def diff(previous, current, previous_stale_before, stale_before):
+    ''' Computes every delta category in one pass over both snapshots.
+    Staleness of each snapshot is judged against the time it was taken so
+    an agent is reported once when it stops checking in.
+    '''
+    delta = dict((key, []) for key in DELTA_KEYS)
+
+    def stale(sensor, before):
+        return not sensor['last_check_in'] or sensor['last_check_in'] < before
+
+    for uuid, sensor in current.items():
+        old = previous.get(uuid)
+        entry = dict(uuid=uuid, host_name=sensor['host_name'])
+        if not old:
+            delta['added'].append(dict(entry, version=sensor['version'], ips=sensor['ips']))
+            continue
+        if old['version'] != sensor['version']:
+            delta['upgraded'].append(dict(entry, old_version=old['version'], version=sensor['version']))
+        if old['ips'] != sensor['ips']:
+            delta['interfaces_changed'].append(dict(entry, old_ips=old['ips'], ips=sensor['ips']))
+        was_stale = stale(old, previous_stale_before)
+        if stale(sensor, stale_before) and not was_stale:
+            delta['stopped_reporting'].append(dict(entry, last_check_in=sensor['last_check_in']))
+        elif not stale(sensor, stale_before) and was_stale:
+            delta['resumed_reporting'].append(dict(entry, last_check_in=sensor['last_check_in']))
+    for uuid, sensor in previous.items():
+        if uuid not in current:
+            delta['removed'].append(dict(uuid=uuid, host_name=sensor['host_name']))
+    return delta
+
+
+def main():
+    argument_spec = dict(
+        snapshot_path=dict(type='path', required=True),
+        stale_after=dict(type='int', default=900),
+        page_size=dict(type='int', default=500),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+    )
+
+    tet_module = TetrationApiModule(module)
+    snapshot_path = module.params['snapshot_path']
+
+    # =========================================================================
+    # Load the previous snapshot and build the current one
+    previous = dict(taken_at=None, sensors={})
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path) as snapshot_file:
+            previous = json.load(snapshot_file)
+    now = int(time.time())
+    current = dict(taken_at=now, sensors={})
+    for sensor in tet_module.get_pages(TETRATION_API_SENSORS, params=dict(limit=module.params['page_size'])):
+        current['sensors'][sensor['uuid']] = compact(sensor)
+
+    stale_after = module.params['stale_after']
+    result = diff(previous['sensors'], current['sensors'],
+                  (previous.get('taken_at') or now) - stale_after, now - stale_after)
+
+    result['changed'] = any(result[key] for key in DELTA_KEYS)
+    result['total'] = len(current['sensors'])
+    if not module.check_mode:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(snapshot_path)))
+        with os.fdopen(fd, 'w') as snapshot_file:
+            json.dump(current, snapshot_file, separators=(',', ':'))
+        os.rename(tmp_path, snapshot_path)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
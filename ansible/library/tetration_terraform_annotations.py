@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: tetration_terraform_annotations
+short_description: Label Tetration hosts from the local Terraform state
+description:
+   - Reads the instances of a Terraform state file (name, private address and
+     tags, as defined in C(aws_compute.tf)) and pushes them to Tetration as
+     user annotations through the file based bulk annotation upload.
+   - Only the delta against the previously pushed rows is uploaded, one
+     request for new or changed hosts and one for removed hosts, so pods are
+     labelled right after C(terraform apply) without per-host API calls.
+requirements:
+    - tetpyclient
+extends_documentation_fragment: tetration
+options:
+  state_file:
+    description:
+    - Terraform state file to read
+    type: path
+    default: terraform.tfstate
+  root_scope_name:
+    description:
+    - Root scope receiving the annotations
+    required: yes
+  vrf:
+    description:
+    - VRF of the instance addresses
+    default: Default
+  tags:
+    description:
+    - Instance tags exported as annotations, all tags when omitted
+    required: no
+    type: list
+  resource_types:
+    description:
+    - Terraform resource types read from the state
+    type: list
+    default: [ aws_instance ]
+  ip_attribute:
+    description:
+    - Instance attribute holding the address known to Tetration
+    default: private_ip
+  pushed_path:
+    description:
+    - JSON file recording the rows pushed by the previous run, defaults to
+      the state file with a C(.tetration.json) suffix
+    required: no
+    type: path
+'''
+
+EXAMPLES = r'''
+- name: Label the siwapp pod in Tetration after apply
+  tetration_terraform_annotations:
+    state_file: "{{ playbook_dir }}/../terraform.tfstate"
+    root_scope_name: Default
+    tags:
+    - Name
+    - ansible_group
+    - ApplicationName
+    - Scope
+    - Owner
+    provider: "{{ tetration_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+added:
+  description: Addresses whose annotations were added or updated
+  returned: always
+  type: list
+removed:
+  description: Addresses whose annotations were deleted
+  returned: always
+  type: list
+'''
+
+import json
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import iteritems
+from ansible.module_utils.tetration.api import TetrationApiModule
+
+
+def read_instances(state_file, resource_types, ip_attribute, tags):
+    ''' Returns annotation rows keyed by address for every instance in a
+    Terraform state file (format version 4)
+    '''
+    with open(state_file) as state:
+        tfstate = json.load(state)
+    if tfstate.get('version') != 4:
+        raise ValueError('Unsupported terraform state format version %s in %s, only version 4 is read'
+                         % (tfstate.get('version'), state_file))
+    rows = {}
+    for resource in tfstate.get('resources', []):
+        if resource.get('mode') != 'managed' or resource.get('type') not in resource_types:
+            continue
+        for instance in resource.get('instances', []):
+            attributes = instance.get('attributes') or {}
+            ip = attributes.get(ip_attribute)
+            if not ip:
+                continue
+            instance_tags = attributes.get('tags') or {}
+            row = dict((key, value) for key, value in iteritems(instance_tags) if tags is None or key in tags)
+            row['terraform_resource'] = '%s.%s' % (resource['type'], resource['name'])
+            rows[ip] = row
+    return rows
+
+
+def main():
+    argument_spec = dict(
+        state_file=dict(type='path', default='terraform.tfstate'),
+        root_scope_name=dict(type='str', required=True),
+        vrf=dict(type='str', default='Default'),
+        tags=dict(type='list', required=False),
+        resource_types=dict(type='list', default=['aws_instance']),
+        ip_attribute=dict(type='str', default='private_ip'),
+        pushed_path=dict(type='path', required=False),
+    )
+    argument_spec.update(TetrationApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+    )
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        added=[],
+        removed=[],
+    )
+
+    state_file = module.params['state_file']
+    pushed_path = module.params['pushed_path'] or state_file + '.tetration.json'
+    vrf = module.params['vrf']
+    if not os.path.exists(state_file):
+        module.fail_json(msg='Unable to find terraform state: %s' % state_file)
+
+    # =========================================================================
+    # Compute the delta against the rows pushed last time
+    try:
+        current = read_instances(state_file, module.params['resource_types'],
+                                 module.params['ip_attribute'], module.params['tags'])
+    except ValueError as e:
+        module.fail_json(msg=str(e))
+    previous = {}
+    if os.path.exists(pushed_path):
+        with open(pushed_path) as pushed_file:
+            previous = json.load(pushed_file)
+    result['added'] = sorted(ip for ip, row in iteritems(current) if previous.get(ip) != row)
+    result['removed'] = sorted(ip for ip in previous if ip not in current)
+    result['changed'] = bool(result['added'] or result['removed'])
+
+    if result['changed'] and not module.check_mode:
+        tet_module = TetrationApiModule(module)
+        root_scope_name = module.params['root_scope_name']
+        # changed rows are overwritten so tags dropped from an instance are
+        # cleared instead of keeping their previous value
+        tet_module.upload_annotations(
+            root_scope_name,
+            [dict(current[ip], IP=ip, VRF=vrf) for ip in result['added'] if ip not in previous],
+            operation='add'
+        )
+        tet_module.upload_annotations(
+            root_scope_name,
+            [dict(current[ip], IP=ip, VRF=vrf) for ip in result['added'] if ip in previous],
+            operation='overwrite'
+        )
+        tet_module.upload_annotations(
+            root_scope_name,
+            [dict(IP=ip, VRF=vrf) for ip in result['removed']],
+            operation='delete'
+        )
+        with open(pushed_path, 'w') as pushed_file:
+            json.dump(current, pushed_file)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
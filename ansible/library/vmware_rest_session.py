@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: vmware_rest_session
+short_description: Manage the cached vCenter REST session
+description:
+   - The vmware_rest modules cache the C(vmware-api-session-id) of the vCenter
+     session under the provider C(state_dir), per host and user, and reuse it
+     across tasks instead of logging in on every task.
+   - Use C(state=present) to open or validate the session up front and
+     C(state=absent) at the end of a play to delete the session on vCenter
+     and remove the cached id.
+options:
+  state:
+    description:
+    - Whether the session should exist
+    choices: [ present, absent ]
+    default: present
+    type: str
+'''
+
+EXAMPLES = r'''
+- name: Close the vCenter session at the end of the play
+  vmware_rest_session:
+    state: absent
+    provider: "{{ vmware_provider }}"
+  connection: local
+  run_once: yes
+'''
+
+RETURN = r'''
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.vmware_rest.api import VmwareApiModule
+
+
+def main():
+    argument_spec = dict(
+        state=dict(type='str', choices=['present', 'absent'], default='present'),
+    )
+    argument_spec.update(VmwareApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=False,
+    )
+
+    # opening the module resumes or creates the session, a session being
+    # closed is only read from the cache
+    vmware_module = VmwareApiModule(module, connect=module.params['state'] == 'present')
+
+    result = dict(changed=False)
+    if module.params['state'] == 'absent':
+        result['changed'] = vmware_module.logout()
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
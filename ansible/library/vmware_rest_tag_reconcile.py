@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: vmware_rest_tag_reconcile
+short_description: Reconcile the vCenter tags of every VM in a folder or resource pool
+description:
+   - Takes the desired tags of each VM and corrects the drift of a whole VM
+     folder, cluster or resource pool in a few calls.
+   - The VMs in scope are listed fresh through the VM index, their current
+     tags are loaded with one C(list-attached-tags-on-objects) call and the
+     differences are computed locally, then applied with one
+     C(attach-tag-to-multiple-objects) or C(detach-tag-from-multiple-objects)
+     call per tag.
+   - Only tags of the given categories are managed, any other tag attached
+     to the VMs is left alone.
+options:
+  vms:
+    description:
+    - Mapping of VM name to the list of tag names the VM should carry
+    required: yes
+    type: dict
+  categories:
+    description:
+    - Names of the categories whose tags are managed
+    required: yes
+    type: list
+  folders:
+    description:
+    - Names of the VM folders in scope
+    type: list
+  clusters:
+    description:
+    - Names of the clusters in scope
+    type: list
+  resource_pools:
+    description:
+    - Names of the resource pools in scope
+    type: list
+  unlisted:
+    description:
+    - What to do with the VMs in scope missing from C(vms), either keep
+      their tags or detach every managed tag from them
+    choices: [ keep, purge ]
+    default: keep
+    type: str
+'''
+
+EXAMPLES = r'''
+- name: Nightly tag drift correction of the lab
+  vmware_rest_tag_reconcile:
+    folders: [lab]
+    categories: [role, pod]
+    vms:
+      pod01-haproxy: [loadbalancer, pod-01]
+      pod01-db1: [database, pod-01]
+    unlisted: purge
+    provider: "{{ vmware_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+attached:
+  description: VM names attached, by C(category/tag) name
+  returned: always
+  type: dict
+  sample: {"role/database": ["pod01-db1"]}
+detached:
+  description: VM names detached, by C(category/tag) name
+  returned: always
+  type: dict
+vms:
+  description: Number of VMs in scope
+  returned: always
+  type: int
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.vmware_rest.api import VmwareApiModule
+
+
+def main():
+    argument_spec = dict(
+        vms=dict(type='dict', required=True),
+        categories=dict(type='list', required=True),
+        folders=dict(type='list', required=False),
+        clusters=dict(type='list', required=False),
+        resource_pools=dict(type='list', required=False),
+        unlisted=dict(type='str', choices=['keep', 'purge'], default='keep'),
+    )
+    argument_spec.update(VmwareApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[['folders', 'clusters', 'resource_pools']],
+        supports_check_mode=True,
+    )
+
+    vmware_module = VmwareApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        attached={},
+        detached={},
+        vms=0,
+    )
+
+    # =========================================================================
+    # Resolve the managed tags
+    categories = dict((category['name'], category['id']) for category in vmware_module.get_categories())
+    missing = [name for name in module.params['categories'] if name not in categories]
+    if missing:
+        module.fail_json(msg='Unable to find categories named: %s' % ', '.join(missing))
+    category_ids = set(categories[name] for name in module.params['categories'])
+    managed = dict((tag['id'], tag) for tag in vmware_module.get_tags() if tag['category_id'] in category_ids)
+    tag_ids = {}
+    for tag in managed.values():
+        tag_ids.setdefault(tag['name'], []).append(tag['id'])
+    # a tag name may exist in several managed categories
+    category_names = dict((category_id, name) for name, category_id in categories.items())
+    labels = dict((tag_id, '%s/%s' % (category_names[tag['category_id']], tag['name'])) for tag_id, tag in managed.items())
+
+    # =========================================================================
+    # Load the VMs in scope and their current tags
+    index = vmware_module.get_vm_index(
+        folders=module.params['folders'],
+        clusters=module.params['clusters'],
+        resource_pools=module.params['resource_pools']
+    )
+    # drift correction must not act on a stale listing
+    index.refresh()
+    in_scope = index.all()
+    vm_names = dict((vm['vm'], vm['name']) for vm in in_scope)
+    result['vms'] = len(in_scope)
+
+    desired = {}
+    for name, vms in index.resolve(list(module.params['vms'])).items():
+        if not vms:
+            module.fail_json(msg='Unable to find vm named: %s' % name)
+        elif len(vms) > 1:
+            module.fail_json(msg='Multiple matches found for vm name: %s' % name)
+        wanted = set()
+        for tag_name in module.params['vms'][name] or []:
+            if len(tag_ids.get(tag_name, [])) != 1:
+                module.fail_json(msg='Unable to find a single tag named %s in categories: %s' % (tag_name, ', '.join(module.params['categories'])))
+            wanted.add(tag_ids[tag_name][0])
+        desired[vms[0]['vm']] = wanted
+    if module.params['unlisted'] == 'purge':
+        for vm_id in vm_names:
+            desired.setdefault(vm_id, set())
+
+    current = vmware_module.get_attached_tags_on_objects(sorted(desired))
+
+    # =========================================================================
+    # Apply the differences grouped per tag
+    attach = {}
+    detach = {}
+    for vm_id, wanted in desired.items():
+        attached = current.get(vm_id, set()) & set(managed)
+        for tag_id in wanted - attached:
+            attach.setdefault(tag_id, []).append(vm_id)
+        for tag_id in attached - wanted:
+            detach.setdefault(tag_id, []).append(vm_id)
+    # detach first so single cardinality categories accept the new tag
+    for tag_id, vm_ids in detach.items():
+        result['detached'][labels[tag_id]] = sorted(vm_names[vm_id] for vm_id in vm_ids)
+        if not module.check_mode:
+            vmware_module.detach_tag_from_objects(managed[tag_id], sorted(vm_ids))
+    for tag_id, vm_ids in attach.items():
+        result['attached'][labels[tag_id]] = sorted(vm_names[vm_id] for vm_id in vm_ids)
+        if not module.check_mode:
+            vmware_module.attach_tag_to_objects(managed[tag_id], sorted(vm_ids))
+    result['changed'] = bool(result['attached'] or result['detached'])
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = r'''
+---
+module: vmware_rest_tag_vms
+short_description: Attach vCenter tags to many VMs at once
+description:
+   - Takes the desired VMs of each tag and applies only the difference with
+     the current associations, read with one
+     C(list-attached-objects-on-tags) call.
+   - VM ids are resolved from the cached vCenter VM index and changes are
+     sent per tag with the C(attach-tag-to-multiple-objects) and
+     C(detach-tag-from-multiple-objects) actions, instead of one call per VM.
+options:
+  tags:
+    description:
+    - Mapping of tag name to the list of VM names carrying the tag
+    required: yes
+    type: dict
+  category:
+    description:
+    - Name of the category of the tags, needed when a tag name exists in
+      several categories
+    type: str
+  purge:
+    description:
+    - Detach the tags from VMs not listed for them
+    type: bool
+    default: no
+'''
+
+EXAMPLES = r'''
+- name: Tag the VMs of a pod
+  vmware_rest_tag_vms:
+    category: pod
+    tags:
+      pod-01: [pod01-loadsim, pod01-haproxy, pod01-app1, pod01-app2, pod01-app3, pod01-db1, pod01-db2, pod01-db3]
+      pod-02: [pod02-loadsim, pod02-haproxy, pod02-app1, pod02-app2, pod02-app3, pod02-db1, pod02-db2, pod02-db3]
+    purge: yes
+    provider: "{{ vmware_provider }}"
+  connection: local
+'''
+
+RETURN = r'''
+attached:
+  description: VM names attached, by tag name
+  returned: always
+  type: dict
+detached:
+  description: VM names (or ids of VMs not listed) detached, by tag name
+  returned: always
+  type: dict
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.vmware_rest.api import VmwareApiModule
+
+
+def main():
+    argument_spec = dict(
+        tags=dict(type='dict', required=True),
+        category=dict(type='str', required=False),
+        purge=dict(type='bool', default=False),
+    )
+    argument_spec.update(VmwareApiModule.provider_spec)
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+    )
+
+    vmware_module = VmwareApiModule(module)
+
+    # These are all elements we put in our return JSON object for clarity
+    result = dict(
+        changed=False,
+        attached={},
+        detached={},
+    )
+
+    # =========================================================================
+    # Resolve tags and VMs
+    category_id = None
+    if module.params['category']:
+        categories = [category for category in vmware_module.get_categories() if category['name'] == module.params['category']]
+        if not categories:
+            module.fail_json(msg='Unable to find category named: %s' % module.params['category'])
+        category_id = categories[0]['id']
+    tags = {}
+    for name in module.params['tags']:
+        tag = vmware_module.get_tag(name, category_id)
+        if tag is None:
+            module.fail_json(msg='Unable to find a single tag named: %s' % name)
+        tags[name] = tag
+
+    names = sorted(set(vm_name for vm_names in module.params['tags'].values() for vm_name in vm_names or []))
+    vm_ids = {}
+    for name, vms in vmware_module.vm_index.resolve(names).items():
+        if len(vms) > 1:
+            module.fail_json(msg='Multiple matches found for vm name: %s' % name)
+        elif vms:
+            vm_ids[name] = vms[0]['vm']
+    missing = [name for name in names if name not in vm_ids]
+    if missing:
+        module.fail_json(msg='Unable to find vms named: %s' % ', '.join(missing))
+    vm_names = dict((vm_id, name) for name, vm_id in vm_ids.items())
+
+    # =========================================================================
+    # Apply the difference per tag
+    current = vmware_module.get_attached_objects_on_tags(list(tags.values()))
+    for name, tag in tags.items():
+        desired = set(vm_ids[vm_name] for vm_name in module.params['tags'][name] or [])
+        attach = desired - current[tag['id']]
+        detach = current[tag['id']] - desired if module.params['purge'] else set()
+        if attach:
+            result['attached'][name] = sorted(vm_names[vm_id] for vm_id in attach)
+            if not module.check_mode:
+                vmware_module.attach_tag_to_objects(tag, sorted(attach))
+        if detach:
+            result['detached'][name] = sorted(vm_names.get(vm_id, vm_id) for vm_id in detach)
+            if not module.check_mode:
+                vmware_module.detach_tag_from_objects(tag, sorted(detach))
+    result['changed'] = bool(result['attached'] or result['detached'])
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
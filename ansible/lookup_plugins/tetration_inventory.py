@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+lookup: tetration_inventory
+short_description: Query the local Tetration inventory mirror
+description:
+  - Returns the inventory records stored by the C(tetration_inventory_mirror)
+    module, without contacting the cluster.
+  - Each term is either an address or a list of C(field=value) pairs separated
+    by spaces, where field is C(ip), C(host_name), C(vrf_id), C(vrf_name) or a
+    user annotation such as C(user_Pod).
+options:
+  _terms:
+    description: Addresses or field queries
+    required: True
+  database:
+    description: Path of the SQLite database written by tetration_inventory_mirror
+    required: True
+'''
+
+EXAMPLES = r'''
+- debug:
+    msg: "{{ lookup('tetration_inventory', '10.12.1.10', database='/tmp/tetration_inventory.db') }}"
+
+- debug:
+    msg: "{{ query('tetration_inventory', 'vrf_name=Default user_Pod=12', database='/tmp/tetration_inventory.db') | map(attribute='ip') | list }}"
+'''
+
+RETURN = r'''
+_raw:
+  description: Matching inventory records
+  type: list
+'''
+
+import json
+import os.path
+import sqlite3
+
+from ansible.errors import AnsibleError
+from ansible.plugins.lookup import LookupBase
+
+# copies of TETRATION_MIRROR_COLUMNS and TETRATION_ANNOTATION_PREFIX in
+# module_utils/tetration/inventory_db.py, lookups cannot import module_utils
+MIRROR_COLUMNS = ['ip', 'host_name', 'vrf_id', 'vrf_name']
+ANNOTATION_PREFIX = 'user_'
+
+
+def parse_term(term):
+    ''' Returns the (field, value) pairs of a term, validated with the
+    rules of InventoryMirror.query
+    '''
+    if '=' not in term:
+        return [('ip', term.strip())]
+    pairs = []
+    for item in term.split():
+        if '=' not in item:
+            raise AnsibleError('tetration_inventory: expected field=value, got %s in term %s' % (item, term))
+        field, value = item.split('=', 1)
+        if field not in MIRROR_COLUMNS and not field.startswith(ANNOTATION_PREFIX):
+            raise AnsibleError('tetration_inventory: unsupported inventory field: %s' % field)
+        pairs.append((field, value))
+    return pairs
+
+
+class LookupModule(LookupBase):
+
+    def run(self, terms, variables=None, **kwargs):
+        database = kwargs.get('database')
+        if not database or not os.path.exists(database):
+            raise AnsibleError('tetration_inventory: unable to find database %s' % database)
+        db = sqlite3.connect(database)
+        ret = []
+        try:
+            for term in terms:
+                clauses = []
+                args = []
+                for field, value in parse_term(term):
+                    if field in MIRROR_COLUMNS:
+                        clauses.append('hosts.%s = ?' % field)
+                        args.append(value)
+                    else:
+                        clauses.append('EXISTS (SELECT 1 FROM annotations a WHERE a.name = ? AND a.value = ? '
+                                       'AND a.ip = hosts.ip AND a.vrf_id = hosts.vrf_id)')
+                        args.extend([field, value])
+                sql = 'SELECT record FROM hosts WHERE ' + ' AND '.join(clauses)
+                ret.extend(json.loads(row[0]) for row in db.execute(sql, args))
+        except sqlite3.Error as exc:
+            raise AnsibleError('tetration_inventory: %s' % exc)
+        finally:
+            db.close()
+        return ret
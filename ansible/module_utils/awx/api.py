@@ -34,13 +34,26 @@ from ansible.module_utils._text import to_text
 from ansible.module_utils.basic import env_fallback
 
 import json
+import hashlib
+import tempfile
+import time
 from urllib2 import quote
 from requests.packages.urllib3 import disable_warnings
 from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 from jinja2 import Environment, FileSystemLoader
 from datetime import datetime, timedelta
+from math import ceil
+from multiprocessing.pool import ThreadPool
 from time import sleep
 
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
+
 
 # Disable SSL Warnings
 disable_warnings()
@@ -52,8 +65,181 @@ AWX_PROVIDER_SPEC = {
     'silent_ssl_warnings': dict(type='bool', default=True),
     'timeout': dict(type='int', default=10),
     'max_retries': dict(type='int', default=3),
+    'workers': dict(type='int', default=4),
+    'cache_dir': dict(type='path', default='~/.ansible/tmp/awx_cache'),
+    'cache_ttl': dict(type='int', default=300),
 }
 
+# object kinds resolved by name, as named in the API path
+AWX_RESOLVED_KINDS = ['job_templates', 'credentials', 'inventories']
+
+# largest page_size AWX accepts on list endpoints
+AWX_MAX_PAGE_SIZE = 200
+
+# job statuses AWX never moves a job out of
+AWX_JOB_FINISHED = ['successful', 'failed', 'error', 'canceled']
+
+# ids per __in filter, keeps list query URLs to a sane length
+AWX_FILTER_CHUNK = 100
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def poll_interval(elapsed, remaining, min_interval, max_interval):
+    ''' Poll interval growing with the elapsed time, capped by what is left '''
+    return max(0, min(max(min_interval, elapsed / 10.0), max_interval, remaining))
+
+
+def line_start(events_file, position, block_size=65536):
+    ''' Returns the offset following the last newline before position,
+    reading backwards block by block, or 0 when there is none
+    '''
+    while position > 0:
+        start = max(0, position - block_size)
+        events_file.seek(start)
+        index = events_file.read(position - start).rfind(b'\n')
+        if index >= 0:
+            return start + index + 1
+        position = start
+    return 0
+
+
+def last_event_counter(path):
+    ''' Returns the counter of the last event in a JSON lines file, first
+    dropping a trailing line left incomplete by an interrupted run. Lines
+    are located by scanning backwards, events can be far larger than a block.
+    '''
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as events_file:
+        events_file.seek(0, os.SEEK_END)
+        end = events_file.tell()
+        if end:
+            events_file.seek(end - 1)
+            if events_file.read(1) != b'\n':
+                end = line_start(events_file, end)
+                events_file.truncate(end)
+        while end > 0:
+            start = line_start(events_file, end - 1)
+            events_file.seek(start)
+            line = events_file.read(end - start)
+            try:
+                return int(json.loads(line.decode('utf-8'))['counter'])
+            except (ValueError, KeyError, TypeError, UnicodeError):
+                end = start
+    return 0
+
+
+def launch_summary(launch):
+    return dict(inventory=launch.get('inventory'), job_id=None, status='not_launched', duration=None)
+
+
+def parse_variables(variables):
+    ''' Parses the JSON or YAML variables embedded in an AWX object,
+    returning None when they cannot be parsed here
+    '''
+    if not variables:
+        return {}
+    try:
+        return json.loads(variables)
+    except ValueError:
+        pass
+    if HAS_YAML:
+        try:
+            parsed = yaml.safe_load(variables)
+            return parsed if isinstance(parsed, dict) else {}
+        except yaml.YAMLError:
+            pass
+    return None
+
+class AwxNameResolver(object):
+    ''' Resolves template, credential and inventory names to ids
+
+    The name -> id maps of every kind are bulk-loaded once and persisted on
+    disk for ttl seconds, so repeated launches resolve names locally. A
+    name missing from the maps falls back to one targeted query. Maps are
+    kept per endpoint and token, since visibility differs between users.
+    '''
+    def __init__(self, api, cache_dir, ttl, endpoint, token):
+        self.api = api
+        self.ttl = int(ttl)
+        name = hashlib.sha1(to_text('%s|%s' % (endpoint, token)).encode('utf-8')).hexdigest()
+        self.path = os.path.join(os.path.expanduser(cache_dir), 'names-%s.json' % name)
+        self.maps = None
+
+    def read(self):
+        ''' Returns the persisted maps if they are still fresh '''
+        try:
+            if self.ttl > 0 and time.time() - os.path.getmtime(self.path) <= self.ttl:
+                with open(self.path) as cache_file:
+                    return json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            pass
+        return None
+
+    def load(self):
+        if self.maps is not None:
+            return
+        self.maps = self.read()
+        if self.maps is not None:
+            return
+        self.maps = dict((kind, {}) for kind in AWX_RESOLVED_KINDS)
+        for kind in AWX_RESOLVED_KINDS:
+            for obj in self.api.paginate(kind + '/'):
+                self.maps[kind][obj['name'].lower()] = obj['id']
+        self.save()
+
+    def save(self):
+        if self.ttl <= 0:
+            return
+        try:
+            cache_dir = os.path.dirname(self.path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, 0o700)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(self.maps, tmp_file)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+    def resolve(self, kind, name):
+        ''' Returns the id of the named object, or None if it does not exist
+
+        A failed lookup is handed to the api handle_exception, so an
+        error answer is not mistaken for a missing object.
+        '''
+        self.load()
+        ids = self.maps.setdefault(kind, {})
+        if name.lower() not in ids:
+            resp = self.api.session.get(self.api.uri + kind + '/', params=dict(name__iexact=name))
+            if resp.status_code != 200:
+                self.api.handle_exception('get', resp)
+                return None
+            results = resp.json().get('results', [])
+            if not results:
+                return None
+            ids[name.lower()] = results[0]['id']
+            self.save()
+        return ids[name.lower()]
+
+    def forget(self, kind, name=None, id=None):
+        ''' Drops the entries of an object deleted, recreated or found stale '''
+        if self.maps is None:
+            # nothing to drop from maps that were never loaded
+            self.maps = self.read()
+            if self.maps is None:
+                return
+        ids = self.maps.setdefault(kind, {})
+        for key in [key for key, value in iteritems(ids) if key == (name or '').lower() or (id is not None and str(value) == str(id))]:
+            del ids[key]
+        self.save()
+
+
 class AwxApiBase(object):
     ''' Base class for implementing AWX API '''
     provider_spec = {'provider': dict(type='dict', options=AWX_PROVIDER_SPEC)}
@@ -83,6 +269,10 @@ class AwxApiBase(object):
         self.session.silent_ssl_warnings = provider['silent_ssl_warnings']
         self.session.timeout = provider['timeout']
         self.session.max_retries = provider['max_retries']
+        self.workers = int(provider['workers'])
+        self.resolver = AwxNameResolver(self, provider['cache_dir'], provider['cache_ttl'], provider['endpoint'], provider['token'])
+        # one pooled connection per worker fetching pages concurrently
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=max(self.workers, 1)))
         self.uri = 'https://%s/api/v2/' % provider['endpoint']
 
     def handle_exception(self, method_name, exc):
@@ -108,19 +298,43 @@ class AwxApiBase(object):
             return resp.json()
         self.handle_exception('get',resp)
 
+    def request_page(self, path, params, page):
+        return self.session.get(self.uri + path, params=dict(params, page=page))
+
+    def page_json(self, resp):
+        if resp.status_code == 200:
+            return resp.json()
+        self.handle_exception('get',resp)
+
+    def get_page(self, path, params, page):
+        return self.page_json(self.request_page(path, params, page))
+
+    def paginate(self, path, params=None, page_size=AWX_MAX_PAGE_SIZE):
+        ''' Lazily yields every result of a list endpoint. The first page
+        gives the total count, the remaining pages are fetched concurrently
+        and yielded in order.
+        '''
+        params = dict(params or {}, page_size=page_size)
+        first = self.get_page(path, params, 1)
+        for result in first['results']:
+            yield result
+        if not first.get('next') or not first['results']:
+            return
+        # AWX clamps page_size to its own MAX_PAGE_SIZE, trust what it sent
+        pages = int(ceil(first['count'] / float(len(first['results']))))
+        pool = ThreadPool(max(1, min(self.workers, pages - 1)))
+        try:
+            # workers only fetch, a failed page must fail the module from
+            # this thread: fail_json exits and would kill a worker silently
+            for resp in pool.imap(lambda number: self.request_page(path, params, number), range(2, pages + 1)):
+                for result in self.page_json(resp)['results']:
+                    yield result
+        finally:
+            pool.terminate()
+
     def get_deployment_inventories(self, property='name'):
-        inventories = []
-        page_size = 10
-        resp = self.session.get(self.uri + 'inventories/?page_size={}&variables__contains={}'.format(page_size, quote("'deployment_owner'")))
-        while True:
-            if resp.status_code == 200:
-                inventories += [ inventory[property] for inventory in resp.json()['results'] ]
-                if resp.json()['next']:
-                    resp = self.session.get(self.uri.split('/api')[0] + resp.json()['next'])
-                else:
-                    return inventories
-            else:
-                self.handle_exception('get',resp)
+        inventories = self.paginate('inventories/', dict(variables__contains="'deployment_owner'"))
+        return [ inventory[property] for inventory in inventories ]
 
     def get_inventory_by_name(self, name):
         resp = self.session.get(self.uri + 'inventories/?name__iexact=' + quote(name))
@@ -136,6 +350,7 @@ class AwxApiBase(object):
 
     def delete_inventory(self, id):
         resp = self.session.delete(self.uri + 'inventories/{}/'.format(id))
+        self.resolver.forget('inventories', id=id)
         return True if resp.status_code == 200 else False
 
     def create_inventory(self, name, description, organization):
@@ -145,6 +360,7 @@ class AwxApiBase(object):
             organization=organization
         )
         resp = self.session.post(self.uri + 'inventories/')
+        self.resolver.forget('inventories', name=name)
         if resp.status_code == 200:
             return resp.json()
         self.handle_exception('post',resp)
@@ -184,42 +400,207 @@ class AwxApiModule(AwxApiBase):
             microsoft=[]
         )
         inventories = self.get_deployment_inventories(property='id')
-        for inventory in inventories:
-            groups = self.get_inventory_groups(inventory)
+        # bucket the groups of every deployment inventory by os_type, read
+        # from the variables embedded in the group listing
+        os_groups = {}
+        for inventory_ids in chunks(inventories, AWX_FILTER_CHUNK):
+            groups = self.paginate('groups/', dict(inventory__in=','.join(str(id) for id in inventory_ids)))
             for group in groups:
-                group_vars = self.get_inventory_group_vars(group['id'])
-                hosts = self.get_inventory_group_hosts(group['id'])
-                if hosts:
-                    if group_vars and 'os_type' in group_vars:
-                        all_deployments[group_vars['os_type']] += [ host['name'] for host in hosts ]
+                group_vars = parse_variables(group.get('variables'))
+                if group_vars is None:
+                    group_vars = self.get_inventory_group_vars(group['id'])
+                if group_vars and 'os_type' in group_vars:
+                    os_groups.setdefault(group_vars['os_type'], []).append(group['id'])
+        # then list the hosts of all groups of an os_type at once
+        for os_type, group_ids in iteritems(os_groups):
+            seen = set()
+            for ids in chunks(group_ids, AWX_FILTER_CHUNK):
+                for host in self.paginate('hosts/', dict(groups__in=','.join(str(id) for id in ids))):
+                    if host['id'] not in seen:
+                        seen.add(host['id'])
+                        all_deployments.setdefault(os_type, []).append(host['name'])
         return all_deployments
 
+    def resolve_id(self, kind, name):
+        id = self.resolver.resolve(kind, name)
+        if id is None:
+            self.module.fail_json(msg='Unable to find %s named: %s' % (kind, name))
+        return id
+
     def launch_job(self, name, inventory, credentials, extra_vars):
-        template_id = self.get_template(name)['id']
+        try:
+            resp = self.request_launch(name, inventory, credentials, extra_vars)
+        except ValueError as exc:
+            self.module.fail_json(msg=to_text(exc))
+        if resp.status_code == 201:
+            return resp.json()
+        self.handle_exception('post',resp)
+
+    def request_launch(self, name, inventory, credentials, extra_vars):
+        ''' Posts a launch and returns the response, raising ValueError
+        when a name does not resolve
+        '''
+        resp = self.post_launch(name, inventory, credentials, extra_vars)
+        if resp.status_code == 404:
+            # a cached id may belong to an object deleted or recreated since
+            self.resolver.forget('job_templates', name=name)
+            self.resolver.forget('inventories', name=inventory)
+            for credential in credentials or []:
+                self.resolver.forget('credentials', name=credential)
+            resp = self.post_launch(name, inventory, credentials, extra_vars)
+        return resp
+
+    def post_launch(self, name, inventory, credentials, extra_vars):
+        def find_id(kind, name):
+            id = self.resolver.resolve(kind, name)
+            if id is None:
+                raise ValueError('Unable to find %s named: %s' % (kind, name))
+            return id
+
+        template_id = find_id('job_templates', name)
         req_payload={}
         if extra_vars:
             req_payload['extra_vars'] = extra_vars
         if credentials:
-            req_payload['credentials'] = []
-            for credential in credentials:
-                resolved_cred = self.get_credential(credential)
-                req_payload['credentials'].append(resolved_cred['id'])
+            req_payload['credentials'] = [ find_id('credentials', credential) for credential in credentials ]
         if inventory:
-            req_payload['inventory_id'] = self.get_inventory_by_name(inventory)['id']
-        resp = self.session.post(self.uri + 'job_templates/{}/launch/'.format(template_id), json=req_payload)
-        if resp.status_code == 201:
-            return resp.json()
-        self.handle_exception('post',resp)
+            req_payload['inventory_id'] = find_id('inventories', inventory)
+        return self.session.post(self.uri + 'job_templates/{}/launch/'.format(template_id), json=req_payload)
+
+    def get_jobs(self, job_ids):
+        ''' Returns {job_id: job} read with id__in list queries '''
+        jobs = {}
+        for ids in chunks(job_ids, AWX_FILTER_CHUNK):
+            for job in self.paginate('jobs/', dict(id__in=','.join(str(id) for id in ids))):
+                jobs[job['id']] = job
+        return jobs
+
+    def wait_jobs(self, job_ids, timeout, min_interval=1, max_interval=30):
+        ''' Yields (job_id, job) as each job reaches a terminal status,
+        polling every pending job with a single list query. The poll
+        interval grows with the elapsed time, from min_interval up to
+        max_interval. Jobs still pending at timeout are yielded with None.
+        '''
+        pending = set(int(job_id) for job_id in job_ids)
+        start = datetime.now()
+        end = start + timedelta(seconds=timeout)
+        while pending:
+            for job_id, job in iteritems(self.get_jobs(sorted(pending))):
+                if job['status'].lower() in AWX_JOB_FINISHED:
+                    pending.discard(job_id)
+                    yield job_id, job
+            now = datetime.now()
+            if not pending or now >= end:
+                break
+            sleep(poll_interval((now - start).total_seconds(), (end - now).total_seconds(), min_interval, max_interval))
+        for job_id in sorted(pending):
+            yield job_id, None
+
+    def get_free_capacity(self, template_id=None):
+        ''' Returns the capacity left in the instance groups the template
+        runs on, or across all instance groups when it has none of its own
+
+        Groups assigned to the inventory or organization of a launch are not
+        looked up, in that case the sum over all groups is an upper bound.
+        '''
+        groups = []
+        if template_id is not None:
+            groups = list(self.paginate('job_templates/{}/instance_groups/'.format(template_id)))
+        if not groups:
+            groups = self.paginate('instance_groups/')
+        free = 0
+        for group in groups:
+            free += max(0, (group.get('capacity') or 0) - (group.get('consumed_capacity') or 0))
+        return free
+
+    def launch_jobs(self, name, launches, max_in_flight, timeout, min_interval=1, max_interval=30):
+        ''' Launches a template once per entry of launches (dicts with the
+        inventory, credentials and extra_vars arguments of launch_job),
+        keeping at most max_in_flight jobs running and starting the next
+        queued launch as soon as one finishes.
+
+        Returns one summary (inventory, job_id, status, duration and, for
+        launches AWX refused, error) per launch, in the order of launches.
+        Extra vars and credentials are left out, they may hold secrets.
+        '''
+        summaries = [launch_summary(launch) for launch in launches]
+        queue = list(range(len(launches)))
+        in_flight = {}
+        start = datetime.now()
+        end = start + timedelta(seconds=timeout)
+        while queue or in_flight:
+            while queue and len(in_flight) < max(1, max_in_flight) and datetime.now() < end:
+                index = queue.pop(0)
+                launch = launches[index]
+                # one refused launch must not lose the job ids of the others
+                try:
+                    resp = self.request_launch(name, launch.get('inventory'), launch.get('credentials'), launch.get('extra_vars'))
+                except (ValueError, RequestException) as exc:
+                    summaries[index].update(status='error', error=to_text(exc))
+                    continue
+                if resp.status_code != 201:
+                    summaries[index].update(status='error', error=resp.text)
+                    continue
+                job = resp.json()
+                summaries[index].update(job_id=job['id'], status='pending')
+                in_flight[job['id']] = (index, datetime.now())
+            if not in_flight:
+                break
+            now = datetime.now()
+            for job_id, job in iteritems(self.get_jobs(sorted(in_flight))):
+                if job['status'].lower() in AWX_JOB_FINISHED:
+                    index, launched = in_flight.pop(job_id)
+                    summaries[index].update(
+                        status=job['status'].lower(),
+                        duration=job.get('elapsed') or (now - launched).total_seconds()
+                    )
+            now = datetime.now()
+            if now >= end:
+                for job_id, (index, launched) in iteritems(in_flight):
+                    summaries[index].update(status='timeout', duration=(now - launched).total_seconds())
+                break
+            if in_flight and (len(in_flight) >= max_in_flight or not queue):
+                sleep(poll_interval((now - start).total_seconds(), (end - now).total_seconds(), min_interval, max_interval))
+        return summaries
+
+    def stream_job_events(self, job_id, path, follow=True, timeout=3600, min_interval=1, max_interval=30):
+        ''' Appends the events of a job to a JSON lines file, only asking
+        for events after the last counter already in the file, so an
+        interrupted stream resumes where it stopped. With follow, new
+        events are polled until the job finishes and all its events are
+        saved, or timeout expires.
+
+        Returns the number of events written.
+        '''
+        counter = last_event_counter(path)
+        written = 0
+        start = datetime.now()
+        end = start + timedelta(seconds=timeout)
+        with open(path, 'a') as events_file:
+            while True:
+                finished = True
+                if follow:
+                    resp = self.session.get(self.uri + 'jobs/{}/'.format(job_id))
+                    if resp.status_code != 200:
+                        # a failed poll is no end of the job, never truncate silently
+                        self.handle_exception('get', resp)
+                    job = resp.json()
+                    # AWX keeps saving events (e.g. the play recap) after the
+                    # job ends and flags event_processing_finished when done
+                    finished = (job['status'].lower() in AWX_JOB_FINISHED
+                                and job.get('event_processing_finished', True))
+                events = self.paginate('jobs/{}/job_events/'.format(job_id), dict(counter__gt=counter, order_by='counter'))
+                for event in events:
+                    events_file.write(json.dumps(event) + '\n')
+                    counter = max(counter, event['counter'])
+                    written += 1
+                events_file.flush()
+                now = datetime.now()
+                if finished or now >= end:
+                    return written
+                sleep(poll_interval((now - start).total_seconds(), (end - now).total_seconds(), min_interval, max_interval))
 
     def wait_job(self, job_id, timeout, interval):
-        end = datetime.now() + timedelta(seconds=timeout)
-        while datetime.now() < end:
-            resp = self.session.get(self.uri + 'jobs/{job_id}/'.format(job_id=job_id))
-            status = resp.json()['status']
-            if status.lower() == 'successful':
-                return True
-            elif status.lower() == 'failed':
-                return False
-            else:
-                sleep(interval)
+        for _, job in self.wait_jobs([job_id], timeout, min_interval=interval, max_interval=max(interval, 30)):
+            return job is not None and job['status'].lower() == 'successful'
         return False
@@ -27,15 +27,48 @@
 #
 
 import os
-from ansible.module_utils._text import to_native
+import re
+import hashlib
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+from ansible.module_utils._text import to_native, to_text
 import json
 from requests import Session, Request
-from bs4 import BeautifulSoup
+from requests.cookies import create_cookie
 from requests.packages.urllib3 import disable_warnings
 
 # Disable SSL Warnings
 disable_warnings()
 
+# where logged in sessions (cookie jar and CSRF token) are kept between runs
+UI_SESSION_DIR = '~/.ansible/tmp/tet_ui'
+
+AUTHENTICITY_TOKEN_RE = re.compile(
+    r'<input[^>]*name="authenticity_token"[^>]*value="([^"]+)"'
+    r'|<input[^>]*value="([^"]+)"[^>]*name="authenticity_token"')
+CSRF_TOKEN_RE = re.compile(
+    r'<meta[^>]*name="csrf-token"[^>]*content="([^"]+)"'
+    r'|<meta[^>]*content="([^"]+)"[^>]*name="csrf-token"')
+
+
+def extract_token(response, pattern, chunk_size=8192):
+    ''' Returns the first match of pattern in a streamed response body,
+    reading no further than the chunk holding it
+    '''
+    buf = ''
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+            buf += to_text(chunk)
+            match = pattern.search(buf)
+            if match:
+                return match.group(1) or match.group(2)
+            # keep enough of the tail for a tag split across chunks
+            buf = buf[-1024:]
+    finally:
+        response.close()
+    return None
+
 class UISession(object):
     def __init__(self):
         self.site = None
@@ -48,18 +81,107 @@ class UISession(object):
         self.base_headers = None
         self.root_app_scope = None
         self.app_scope = None
-    
+        self.session_dir = UI_SESSION_DIR
+        self.pinned_scope = None
+
+    def session_path(self):
+        name = hashlib.sha1(to_text('%s|%s' % (self.site, self.username)).encode('utf-8')).hexdigest()
+        return os.path.join(os.path.expanduser(self.session_dir), name + '.json')
+
+    def save_session(self):
+        ''' Persists the cookie jar and CSRF token, readable by the owner only '''
+        state = dict(
+            csrf=self.csrf,
+            cookies=[dict(name=c.name, value=c.value, domain=c.domain, path=c.path,
+                          secure=c.secure, expires=c.expires) for c in self.session.cookies]
+        )
+        path = self.session_path()
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), 0o700)
+            # mkstemp files are private (0600) and unique to this fork
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as session_file:
+                json.dump(state, session_file)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            pass
+
+    def discard_session(self):
+        try:
+            os.remove(self.session_path())
+        except (IOError, OSError):
+            pass
+
+    def resume(self):
+        ''' Restores a persisted session and validates it with a single
+        request, returning False when it is missing or has expired
+        '''
+        try:
+            with open(self.session_path()) as session_file:
+                state = json.load(session_file)
+        except (IOError, OSError, ValueError):
+            return False
+        self.session = Session()
+        for cookie in state.get('cookies', []):
+            self.session.cookies.set_cookie(create_cookie(**cookie))
+        self.set_base_headers(state.get('csrf'))
+        self.csrf = state.get('csrf')
+        self.logged_in = True
+        try:
+            valid = self.load_current_user()
+        except Exception:
+            valid = False
+        if not valid:
+            self.logged_in = False
+            self.session = None
+            self.discard_session()
+            return False
+        return True
+
+    def set_base_headers(self, token):
+        self.base_headers = {
+            'Host': self.site,
+            'Connection': 'keep-alive',
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.109 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'X-CSRF-Token':token
+            }
+
+    def set_session_headers(self):
+        self.base_headers['Origin']='https://{}'.format(self.site)
+        self.base_headers['Referer']='https://{}'.format(self.site)
+        self.base_headers['cache-control']='no-cache'
+
+    def load_current_user(self):
+        path = '/current_user.json?concise=true'
+        r = self.request(path=path,method='GET')
+        if r.status_code != 200:
+            return False
+        try:
+            current_user = r.json()
+            self.root_app_scope = current_user['preferences']['root_app_scope']
+            self.app_scope = current_user['preferences']['app_scope']
+            self.user_id = current_user['id']
+        except (ValueError, KeyError, TypeError):
+            return False
+        self.set_session_headers()
+        return True
+
     def login(self,user,password,site):
         self.ServerConnect = False
         self.site = site
         self.username = user
         self.password = password
+        if self.resume():
+            return True
         try:
             self.session = Session()
             url = 'https://{}/h4_users/sign_in'.format(site)
-            response = self.session.get(url, verify=False)
-            html_soup = BeautifulSoup(response.text, 'html.parser')
-            token = html_soup.find('input', attrs = {'name':'authenticity_token'})['value']
+            response = self.session.get(url, verify=False, stream=True)
+            token = extract_token(response, AUTHENTICITY_TOKEN_RE)
             self.csrf = token
 
             url = 'https://{}/h4_users/sign_in'.format(site)
@@ -71,15 +193,7 @@ class UISession(object):
             'commit': 'Sign in',
             'utf8': '&#x2713;'}
 
-            self.base_headers = {
-                'Host': site,
-                'Connection': 'keep-alive',
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.109 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'X-CSRF-Token':token
-                }
+            self.set_base_headers(token)
 
             headers = dict(self.base_headers)
             # del headers['X-CSRF-Token']
@@ -92,15 +206,9 @@ class UISession(object):
             resp = self.session.send(prepped,verify=False)
             if resp.status_code == 200 or resp.status_code == 302:
                 self.logged_in = True
-                path = '/current_user.json?concise=true'
-                r = self.request(path=path,method='GET')
-                self.root_app_scope = r.json()['preferences']['root_app_scope']
-                self.app_scope = r.json()['preferences']['app_scope']
-                self.user_id = r.json()['id']
-                self.get_csrf()
-                self.base_headers['Origin']='https://{}'.format(site)
-                self.base_headers['Referer']='https://{}'.format(site)
-                self.base_headers['cache-control']='no-cache'
+                # a login without user, scope or CSRF token is no login
+                if token is None or not self.load_current_user() or self.get_csrf() is None:
+                    raise ValueError('Unable to establish a UI session')
                 return True
             else:
                 self.logged_in = False
@@ -109,14 +217,17 @@ class UISession(object):
         except:
             self.logged_in = False
             self.session = None
+            self.discard_session()
             return False
     
     def get_csrf(self):
-        r = self.request(path='/',method='GET')
-        html_soup = BeautifulSoup(r.text, 'html.parser')
-        token = html_soup.find('meta', attrs = {'name':'csrf-token'})['content']
+        r = self.session.get('https://{}/'.format(self.site), headers=self.base_headers, allow_redirects=True, stream=True)
+        token = extract_token(r, CSRF_TOKEN_RE)
         self.csrf = token
         self.base_headers['X-CSRF-Token'] = token
+        if token is not None:
+            self.save_session()
+        return token
 
     def logout(self):
         url = "https://{}/lab/nbs/hub/h4_nb_logout".format(self.site)
@@ -124,6 +235,7 @@ class UISession(object):
         r = self.session.post(url,headers=self.base_headers)
         url = "https://{}/logout".format(self.site)
         r = self.session.post(url,headers=self.base_headers)
+        self.discard_session()
         self.site = None
         self.user = None
         self.password = None
@@ -133,6 +245,9 @@ class UISession(object):
         self.headers = None
     
     def set_scope(self,scope_id):
+        if self.pinned_scope:
+            # the preference is per user, it would move every other session
+            raise ValueError('set_scope is not allowed on a session pinned to scope {}'.format(self.pinned_scope))
         data = {'value':scope_id}
         r = self.request(path='/api/preferences/app_scope_id.json',method='PUT',json=data)
         if r.status_code == 200:
@@ -145,9 +260,39 @@ class UISession(object):
             self.app_scope = r.json()['preferences']['app_scope']
         return r
 
+    def clone(self, scope_id=None):
+        ''' Returns a new session sharing this login, optionally pinned to a
+        scope. A pinned session sends app_scope_id with every request
+        instead of changing the user's app scope preference.
+
+        The pin only holds for endpoints taking app_scope_id as a query
+        parameter (the /api resources listed per scope, e.g. inventory
+        filters and applications). Endpoints reading the scope from the
+        user's preference ignore it and answer for the preferred scope, so
+        only use pinned sessions with the former. set_scope is refused on
+        pinned sessions.
+        '''
+        clone = UISession()
+        clone.site = self.site
+        clone.username = self.username
+        clone.user_id = self.user_id
+        clone.csrf = self.csrf
+        clone.logged_in = self.logged_in
+        clone.base_headers = dict(self.base_headers)
+        clone.root_app_scope = self.root_app_scope
+        clone.app_scope = self.app_scope
+        clone.session_dir = self.session_dir
+        clone.session = Session()
+        clone.session.cookies.update(self.session.cookies)
+        clone.pinned_scope = scope_id
+        return clone
+
     def request(self, path, method, params=None, data=None, files=None,add_headers=None,json=None,verify=False):
         if self.logged_in == False:
             return {'success':0,'error':'You must be log in first.'}
+        if self.pinned_scope:
+            params = dict(params or {})
+            params.setdefault('app_scope_id', self.pinned_scope)
         if add_headers != None:
             headers = self.base_headers.copy()
             headers.update(add_headers)
@@ -169,4 +314,43 @@ class UISession(object):
             headers['Content-Type']='application/json;charset=UTF-8'
             headers['Accept']='application/json, text/plain, */*'
             r = self.session.put('https://{}{}'.format(self.site,path), headers=headers, params=params, json=json)
-            return r
\ No newline at end of file
+            return r
+
+
+class UISessionPool(object):
+    ''' Pool of UI sessions pinned to scopes
+
+    All sessions share a single login. Asking for a scope returns a
+    ready session for it, so requests for different scopes can run
+    concurrently without flipping the user's scope preference back and
+    forth with set_scope. See UISession.clone for the endpoints honoring
+    the pinned scope.
+    '''
+    def __init__(self, user, password, site, size=4):
+        self.size = size
+        self.base = UISession()
+        if not self.base.login(user, password, site):
+            raise ValueError('Unable to login to {} as {}'.format(site, user))
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, scope_id):
+        with self.lock:
+            if scope_id not in self.sessions:
+                self.sessions[scope_id] = self.base.clone(scope_id)
+            return self.sessions[scope_id]
+
+    def map(self, func, scope_ids):
+        ''' Calls func(session) for each scope concurrently and returns the
+        results in the order of scope_ids
+        '''
+        pool = ThreadPool(max(1, min(self.size, len(scope_ids))))
+        try:
+            return pool.map(lambda scope_id: func(self.session(scope_id)), scope_ids)
+        finally:
+            pool.close()
+            pool.join()
+
+    def close(self):
+        self.sessions = {}
+        self.base.logout()
@@ -30,16 +30,36 @@ import os
 from functools import partial
 from ansible.module_utils._text import to_native
 from ansible.module_utils.six import iteritems, iterkeys
+from ansible.module_utils.six.moves.urllib.parse import urljoin
 from ansible.module_utils._text import to_text
+from ansible.module_utils.common.collections import ImmutableDict
+import csv
 import json
+import errno
+import fcntl
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from requests import Request, Session
+from requests.adapters import HTTPAdapter
 from requests.packages.urllib3 import disable_warnings
+from ansible.module_utils.tetration.scope_tree import ScopeTree, TETRATION_SCOPE_SEPARATOR
 
 try:
-    from tetpyclient import RestClient
+    from tetpyclient import RestClient, MultiPartOption
     HAS_TETRATION_CLIENT = True
 except ImportError:
     HAS_TETRATION_CLIENT = False
 
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
 # defining tetration constants
 TETRATION_API_INVENTORY_TAG = '/inventory/tags'
 TETRATION_API_ROLE = '/roles'
@@ -54,8 +74,37 @@ TETRATION_API_APPLICATIONS = '/applications'
 TETRATION_API_APPLICATION_POLICIES = '/policies'
 TETRATION_API_AGENT_CONFIG_PROFILES = '/inventory_config/profiles'
 TETRATION_API_AGENT_CONFIG_INTENTS = '/inventory_config/intents'
+TETRATION_API_AGENT_CONFIG_ORDERS = '/inventory_config/orders'
 TETRATION_COLUMN_NAMES = '/assets/cmdb/attributenames'
 TETRATION_API_EXT_ORCHESTRATORS = '/orchestrator'
+TETRATION_API_INVENTORY_SEARCH = '/inventory/search'
+TETRATION_API_ANNOTATION_UPLOAD = '/assets/cmdb/upload'
+
+# record kinds of application policy and ADM exports, with the path of each
+# record in the document in ijson prefix notation
+TETRATION_EXPORT_RECORDS = {
+    'default_policies': 'default_policies.item',
+    'absolute_policies': 'absolute_policies.item',
+    'inventory_filters': 'inventory_filters.item',
+    'clusters': 'clusters.item',
+    'members': 'clusters.item.nodes.item',
+}
+
+# inventory search filter matching every IPv4 and IPv6 address
+TETRATION_INVENTORY_ALL = dict(type='or', filters=[
+    dict(type='subnet', field='ip', value='0.0.0.0/0'),
+    dict(type='subnet', field='ip', value='::/0')
+])
+
+# Slow-changing resource families whose reads are served from the disk cache.
+# A write to any target under one of these prefixes invalidates the family.
+TETRATION_CACHED_TARGETS = [
+    TETRATION_API_SCOPES,
+    TETRATION_API_INVENTORY_FILTER,
+    TETRATION_API_ROLE,
+    TETRATION_API_TENANT,
+    TETRATION_API_AGENT_CONFIG_PROFILES,
+]
 
 # Disable SSL Warnings
 disable_warnings()
@@ -68,9 +117,180 @@ TETRATION_PROVIDER_SPEC = {
     'silent_ssl_warnings': dict(type='bool', default=True),
     'timeout': dict(type='int', default=10),
     'max_retries': dict(type='int', default=3),
-    'api_version': dict(type='str', default='v1')
+    'api_version': dict(type='str', default='v1'),
+    'cache_dir': dict(type='path', default='~/.ansible/tmp/tetration_cache'),
+    'cache_ttl': dict(type='int', default=300),
+    'pool_size': dict(type='int', default=10)
 }
 
+# provider options consumed by this module rather than by tetpyclient
+TETRATION_LOCAL_OPTIONS = ['cache_dir', 'cache_ttl', 'pool_size']
+
+# provider options identifying a reusable RestClient
+TETRATION_CLIENT_KEY = ['server_endpoint', 'api_key', 'api_secret', 'verify', 'api_version']
+
+# RestClients shared by every API object created in this process
+_REST_CLIENTS = {}
+_REST_CLIENTS_LOCK = threading.Lock()
+
+
+def get_rest_client(provider, pool_size):
+    ''' Returns the pooled RestClient for the provider, creating it once.
+    Its keep-alive session keeps up to pool_size warm connections, so API
+    objects created later in the same process skip the TLS handshake.
+    '''
+    key = tuple(to_text(provider.get(option)) for option in TETRATION_CLIENT_KEY)
+    with _REST_CLIENTS_LOCK:
+        if key not in _REST_CLIENTS:
+            rc = RestClient(**provider)
+            session = getattr(rc, 'session', None)
+            if isinstance(session, Session) and pool_size:
+                adapter = HTTPAdapter(pool_connections=int(pool_size), pool_maxsize=int(pool_size),
+                                      max_retries=int(provider.get('max_retries') or 0))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+            _REST_CLIENTS[key] = rc
+        return _REST_CLIENTS[key]
+
+
+def stream_get(rc, uri_path, params=None, timeout=None):
+    ''' Sends a signed GET whose body is read lazily
+
+    RestClient.get never passes stream to requests, so the request is
+    prepared and signed here the way RestClient.download does it.
+    '''
+    if not uri_path.startswith(rc.uri_prefix):
+        uri_path = rc.uri_prefix + uri_path
+    req = rc.session.prepare_request(Request('GET', urljoin(rc.server_endpoint, uri_path), params=params))
+    req.headers['Content-Type'] = 'application/json'
+    rc._RestClient__add_custom_headers(req)
+    rc._RestClient__add_auth_header(req)
+    return rc.session.send(req, timeout=timeout, verify=rc.verify, stream=True)
+
+
+def iter_prefix(document, prefix):
+    ''' Yields the values at an ijson prefix of an already parsed document '''
+    values = [document]
+    for key in prefix.split('.') if prefix else []:
+        selected = []
+        for value in values:
+            if key == 'item' and isinstance(value, list):
+                selected.extend(value)
+            elif isinstance(value, dict) and key in value:
+                selected.append(value[key])
+        values = selected
+    return iter(values)
+
+
+def select_fields(record, fields):
+    ''' Keeps only the given (dotted) fields of a record '''
+    selected = {}
+    for field in fields:
+        value = record
+        for key in field.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        selected[field] = value
+    return selected
+
+
+class TetrationCache(object):
+    ''' Read-through JSON cache shared by every fork on the controller
+
+    Entries are grouped per resource family under a directory named after
+    the cluster and API key, so each tenant gets its own cache. Access is
+    serialized with a per-family flock and every invalidation bumps a
+    generation counter, which stops a fork that read before a write from
+    storing a stale response after it.
+    '''
+    def __init__(self, cache_dir, ttl, server_endpoint, api_key):
+        self.ttl = int(ttl)
+        tenant = hashlib.sha1(to_text('%s|%s' % (server_endpoint, api_key)).encode('utf-8')).hexdigest()
+        self.path = os.path.join(os.path.expanduser(cache_dir), tenant)
+
+    def family(self, target):
+        if self.ttl <= 0 or not target:
+            return None
+        path = target.split('?')[0]
+        for cached in TETRATION_CACHED_TARGETS:
+            if path == cached or path.startswith(cached + '/'):
+                return cached.strip('/').replace('/', '_')
+        return None
+
+    @contextmanager
+    def lock(self, family, exclusive=False):
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path, 0o700)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+        with open(os.path.join(self.path, '%s.lock' % family), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _entry(self, family, target, params):
+        key = json.dumps([target, params], sort_keys=True, default=to_text)
+        return os.path.join(self.path, family, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _generation(self, family):
+        try:
+            with open(os.path.join(self.path, '%s.generation' % family)) as gen_file:
+                return int(gen_file.read() or 0)
+        except (IOError, OSError, ValueError):
+            return 0
+
+    def generation(self, family):
+        try:
+            with self.lock(family):
+                return self._generation(family)
+        except (IOError, OSError):
+            return None
+
+    def get(self, family, target, params):
+        ''' Returns a (hit, value) tuple for the cached response of target '''
+        entry = self._entry(family, target, params)
+        try:
+            with self.lock(family):
+                if time.time() - os.path.getmtime(entry) > self.ttl:
+                    return False, None
+                with open(entry) as entry_file:
+                    return True, json.load(entry_file)['data']
+        except (IOError, OSError, ValueError, KeyError):
+            return False, None
+
+    def set(self, family, target, params, data, generation):
+        if generation is None:
+            return
+        entry = self._entry(family, target, params)
+        try:
+            with self.lock(family, exclusive=True):
+                # a write landed since this response was requested
+                if self._generation(family) != generation:
+                    return
+                family_path = os.path.dirname(entry)
+                if not os.path.isdir(family_path):
+                    os.makedirs(family_path, 0o700)
+                fd, tmp_path = tempfile.mkstemp(dir=family_path)
+                with os.fdopen(fd, 'w') as tmp_file:
+                    json.dump(dict(data=data), tmp_file)
+                os.rename(tmp_path, entry)
+        except (IOError, OSError, TypeError, ValueError):
+            pass
+
+    def invalidate(self, family):
+        try:
+            with self.lock(family, exclusive=True):
+                generation = self._generation(family) + 1
+                with open(os.path.join(self.path, '%s.generation' % family), 'w') as gen_file:
+                    gen_file.write(str(generation))
+                shutil.rmtree(os.path.join(self.path, family), ignore_errors=True)
+        except (IOError, OSError):
+            pass
+
+
 class TetrationApiBase(object):
     ''' Base class for implementing Tetration API '''
     provider_spec = {'provider': dict(type='dict', options=TETRATION_PROVIDER_SPEC)}
@@ -80,10 +300,9 @@ class TetrationApiBase(object):
             raise Exception('tetpyclient is required but does not appear '
                             'to be installed.  It can be installed using the '
                             'command `pip install tetpyclient`')
-        if len(provider.keys()) > 0:
-            for key in provider.keys():
-                if key not in TETRATION_PROVIDER_SPEC.keys():
-                    del provider[key]
+        # work on a copy limited to known options rather than deleting
+        # keys from the caller's dict while iterating over it
+        provider = dict((key, value) for key, value in iteritems(provider) if key in TETRATION_PROVIDER_SPEC)
         for key, value in iteritems(TETRATION_PROVIDER_SPEC):
             if key not in provider:
                 # apply default values from NIOS_PROVIDER_SPEC since we cannot just
@@ -98,7 +317,15 @@ class TetrationApiBase(object):
                 # if key is required but still not defined raise Exception
                 if key not in provider and 'required' in value and value['required']:
                     raise ValueError('option: %s is required' % key)
-        self.rc = RestClient(**provider)
+        local_options = dict((key, provider.pop(key)) for key in TETRATION_LOCAL_OPTIONS if key in provider)
+        self.cache = TetrationCache(
+            local_options.get('cache_dir') or TETRATION_PROVIDER_SPEC['cache_dir']['default'],
+            local_options.get('cache_ttl') or 0,
+            provider['server_endpoint'],
+            provider['api_key']
+        )
+        self.rc = get_rest_client(provider, local_options.get('pool_size'))
+        self.timeout = provider.get('timeout')
 
 
 class TetrationApiModule(TetrationApiBase):
@@ -158,17 +385,32 @@ class TetrationApiModule(TetrationApiBase):
         return methods[method_name.lower()](target,params,req_payload)
 
     def get(self, target, params, req_payload):
+        family = self.cache.family(target)
+        if family:
+            hit, result = self.cache.get(family, target, params)
+            if hit:
+                return result
+            generation = self.cache.generation(family)
         resp = self.rc.get(target, params=params)
         # import pdb; pdb.set_trace()
         if resp.status_code == 400:
             return None
         elif resp.status_code == 200:
-            return resp.json()
+            result = resp.json()
+            if family:
+                self.cache.set(family, target, params, result, generation)
+            return result
         else:
             self.handle_exception('get', resp)
 
+    def invalidate_cache(self, target):
+        family = self.cache.family(target)
+        if family:
+            self.cache.invalidate(family)
+
     def post(self, target, params, req_payload):
         resp = self.rc.post(target, json_body=json.dumps(req_payload))
+        self.invalidate_cache(target)
         if resp.status_code in [200,201,203]:
             try:
                 return resp.json()
@@ -178,6 +420,7 @@ class TetrationApiModule(TetrationApiBase):
             self.handle_exception('post', resp)
     def put(self, target, params, req_payload):
         resp = self.rc.put(target, json_body=json.dumps(req_payload))
+        self.invalidate_cache(target)
         if resp.status_code in [200,201,203]:
             try:
                 return resp.json()
@@ -188,6 +431,7 @@ class TetrationApiModule(TetrationApiBase):
 
     def delete(self, target, params, req_payload):
         resp = self.rc.delete(target, json_body=json.dumps(req_payload))
+        self.invalidate_cache(target)
         if resp.status_code in [200,201,203]:
             try:
                 return resp.json()
@@ -196,6 +440,153 @@ class TetrationApiModule(TetrationApiBase):
         else:
             self.handle_exception('delete', resp)
 
+    def get_scope_tree(self):
+        ''' Builds a ScopeTree from one read of every app scope '''
+        scopes = self.get(target=TETRATION_API_SCOPES, params=None, req_payload=None)
+        return ScopeTree(scopes or [])
+
+    def create_scope(self, tree, parent, short_name, short_query, description=None):
+        ''' Creates a child scope and records it in tree so deeper levels
+        can be created without re-reading the scope list
+        '''
+        req_payload = dict(
+            short_name=short_name,
+            short_query=short_query,
+            parent_app_scope_id=parent['id']
+        )
+        if description:
+            req_payload['description'] = description
+        scope = self.post(target=TETRATION_API_SCOPES, params=None, req_payload=req_payload)
+        if not scope:
+            self.module.fail_json(msg='Unable to create scope: %s' % short_name)
+        return tree.add(scope)
+
+    def ensure_scope(self, tree, name, short_queries, description=None):
+        ''' Returns the scope with the full name, creating any missing levels
+
+        short_queries maps the full name of each level that may need to be
+        created to its short_query.
+        '''
+        parent, missing = tree.split_name(name)
+        if not parent:
+            self.module.fail_json(msg='Unable to find root scope for: %s' % name)
+        for short_name in missing:
+            full_name = TETRATION_SCOPE_SEPARATOR.join([parent['name'], short_name])
+            if full_name not in short_queries:
+                self.module.fail_json(msg='No short_query provided for scope: %s' % full_name)
+            parent = self.create_scope(tree, parent, short_name, short_queries[full_name], description)
+        return parent
+
+    def get_pages(self, target, params=None, sub_element='results'):
+        ''' Yields the objects of a paged GET, following the offset '''
+        params = dict(params or {})
+        while True:
+            page = self.get(target=target, params=params, req_payload=None)
+            # get answers None on HTTP 400, a missing page is not an end
+            if page is None:
+                self.module.fail_json(msg='Unable to read %s' % target, params=params)
+            if not page:
+                return
+            for obj in (page.get(sub_element, []) if isinstance(page, dict) else page):
+                yield obj
+            if not isinstance(page, dict) or not page.get('offset'):
+                return
+            params['offset'] = page['offset']
+
+    def search_inventory(self, query=None, scope_name=None, limit=1000, offset=None):
+        ''' Yields each page of inventory search results, with its
+        continuation offset, until the cluster returns no offset
+        '''
+        req_payload = dict(
+            filter=query or TETRATION_INVENTORY_ALL,
+            limit=limit
+        )
+        if scope_name:
+            req_payload['scopeName'] = scope_name
+        while True:
+            if offset:
+                req_payload['offset'] = offset
+            page = self.post(target=TETRATION_API_INVENTORY_SEARCH, params=None, req_payload=req_payload)
+            if not page:
+                return
+            yield page
+            offset = page.get('offset')
+            if not offset:
+                return
+
+    def get_filter_ids(self, tree=None):
+        ''' Maps inventory filter names and full scope names to their ids '''
+        filter_ids = {}
+        for inventory_filter in self.get(target=TETRATION_API_INVENTORY_FILTER, params=None, req_payload=None) or []:
+            filter_ids[inventory_filter['name']] = inventory_filter['id']
+        for name, scope in iteritems((tree or self.get_scope_tree()).by_name):
+            filter_ids.setdefault(name, scope['id'])
+        return filter_ids
+
+    def export_application(self, application_id):
+        return self.get(target='%s/%s/export' % (TETRATION_API_APPLICATIONS, application_id), params=None, req_payload=None)
+
+    def iter_records(self, target, prefix, fields=None, params=None):
+        ''' Yields the records at prefix of a large JSON response one at a
+        time, parsing the body as it streams in so memory stays flat.
+        Falls back to parsing the whole body when ijson is not installed.
+        '''
+        resp = stream_get(self.rc, target, params=params, timeout=self.timeout)
+        if resp.status_code != 200:
+            self.handle_exception('get', resp)
+        try:
+            if HAS_IJSON and not resp._content_consumed:
+                resp.raw.decode_content = True
+                records = ijson.items(resp.raw, prefix, use_float=True)
+            else:
+                records = iter_prefix(resp.json(), prefix)
+            for record in records:
+                yield select_fields(record, fields) if fields else record
+        finally:
+            resp.close()
+
+    def iter_application(self, application_id, record='default_policies', fields=None, version=None):
+        ''' Streams one kind of record (see TETRATION_EXPORT_RECORDS) from
+        an application's policy and ADM export
+        '''
+        params = dict(version=version) if version else None
+        return self.iter_records(
+            target='%s/%s/export' % (TETRATION_API_APPLICATIONS, application_id),
+            prefix=TETRATION_EXPORT_RECORDS[record],
+            fields=fields,
+            params=params
+        )
+
+    def import_application(self, application_id, req_payload):
+        ''' Pushes a complete policy set as a new version of the application '''
+        return self.post(target='%s/%s/import' % (TETRATION_API_APPLICATIONS, application_id), params=None, req_payload=req_payload)
+
+    def upload_annotations(self, root_scope_name, rows, operation='add'):
+        ''' Uploads user annotations for many hosts in a single request
+
+        rows are dicts keyed by column name and must include IP and VRF.
+        operation is one of add, overwrite, merge or delete.
+        '''
+        if not rows:
+            return None
+        columns = ['IP', 'VRF'] + sorted(set(key for row in rows for key in row) - set(['IP', 'VRF']))
+        fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+            resp = self.rc.upload(csv_path, '%s/%s' % (TETRATION_API_ANNOTATION_UPLOAD, root_scope_name),
+                                  [MultiPartOption(key='X-Tetration-Oper', val=operation)])
+        finally:
+            os.remove(csv_path)
+        if resp.status_code in [200,201,203]:
+            try:
+                return resp.json()
+            except ValueError:
+                return None
+        self.handle_exception('upload', resp)
+
     def filter_object(self, obj1, obj2, check_only=False):
         changed_flag = False
         try:
@@ -368,4 +759,8 @@ dict(name='WSN',value=74),
 dict(name='XNET',value=15),
 dict(name='XNS-IDP',value=22),
 dict(name='XTP',value=36),
-]
\ No newline at end of file
+]
+
+# frozen lookups over TETRATION_API_PROTOCOLS; names are upper-cased
+TETRATION_PROTOCOLS_BY_NAME = ImmutableDict((protocol['name'].upper(), protocol['value']) for protocol in TETRATION_API_PROTOCOLS)
+TETRATION_PROTOCOLS_BY_NUMBER = ImmutableDict((protocol['value'], protocol['name']) for protocol in TETRATION_API_PROTOCOLS if protocol['value'] != "")
@@ -0,0 +1,212 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# (c) 2018 Red Hat Inc.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import re
+import socket
+from binascii import hexlify
+from ansible.module_utils._text import to_text
+
+# inventory fields holding addresses; these are compared as integers
+TETRATION_IP_FIELDS = ['ip', 'address']
+
+# key under which InventorySnapshot keeps the pre-parsed address of a record
+TETRATION_IP_KEY = '__ip__'
+
+
+def ip_to_int(address):
+    ''' Returns (family, integer) for an IPv4 or IPv6 address, or None '''
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            return family, int(hexlify(socket.inet_pton(family, to_text(address).strip())), 16)
+        except (socket.error, ValueError, TypeError, UnicodeError):
+            continue
+    return None
+
+
+def subnet_to_range(subnet):
+    ''' Returns (family, first, last) integers covered by a CIDR subnet '''
+    address, _, prefix = to_text(subnet).partition('/')
+    parsed = ip_to_int(address)
+    if not parsed:
+        raise ValueError('invalid subnet: %s' % subnet)
+    family, value = parsed
+    bits = 32 if family == socket.AF_INET else 128
+    prefix = int(prefix) if prefix else bits
+    if not 0 <= prefix <= bits:
+        raise ValueError('invalid subnet: %s' % subnet)
+    host_mask = (1 << (bits - prefix)) - 1
+    first = value & ~host_mask
+    return family, first, first | host_mask
+
+
+def _record_ip(record, field):
+    if field == 'ip' and TETRATION_IP_KEY in record:
+        return record[TETRATION_IP_KEY]
+    value = record.get(field)
+    return ip_to_int(value) if value is not None else None
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _compare(operator):
+    def compile_compare(field, value):
+        expected_number = _number(value)
+
+        def predicate(record):
+            actual = record.get(field)
+            if actual is None:
+                return False
+            actual_number = _number(actual)
+            if expected_number is not None and actual_number is not None:
+                return operator(actual_number, expected_number)
+            return operator(to_text(actual), to_text(value))
+        return predicate
+    return compile_compare
+
+
+def _compile_eq(field, value):
+    if field in TETRATION_IP_FIELDS:
+        expected = ip_to_int(value)
+        if expected:
+            return lambda record: _record_ip(record, field) == expected
+    expected = to_text(value)
+    return lambda record: record.get(field) is not None and to_text(record[field]) == expected
+
+
+def _compile_subnet(field, value):
+    family, first, last = subnet_to_range(value)
+
+    def predicate(record):
+        address = _record_ip(record, field)
+        return address is not None and address[0] == family and first <= address[1] <= last
+    return predicate
+
+
+def _compile_contains(field, value):
+    expected = to_text(value)
+    return lambda record: record.get(field) is not None and expected in to_text(record[field])
+
+
+def _compile_regex(field, value):
+    pattern = re.compile(to_text(value))
+    return lambda record: record.get(field) is not None and pattern.search(to_text(record[field])) is not None
+
+
+def _compile_in(field, value):
+    if field in TETRATION_IP_FIELDS:
+        # an unparsable address must not match records without one
+        expected = set(ip_to_int(item) for item in value) - set([None])
+        return lambda record: _record_ip(record, field) in expected
+    expected = set(to_text(item) for item in value)
+    return lambda record: record.get(field) is not None and to_text(record[field]) in expected
+
+
+TETRATION_FIELD_OPERATORS = {
+    'eq': _compile_eq,
+    'subnet': _compile_subnet,
+    'contains': _compile_contains,
+    'regex': _compile_regex,
+    'in': _compile_in,
+    'lt': _compare(lambda a, b: a < b),
+    'lte': _compare(lambda a, b: a <= b),
+    'gt': _compare(lambda a, b: a > b),
+    'gte': _compare(lambda a, b: a >= b),
+}
+
+
+def compile_query(query):
+    ''' Compiles a Tetration filter query into a predicate over inventory
+    records. Raises ValueError for query types that cannot be evaluated.
+    '''
+    if not query:
+        return lambda record: True
+    query_type = to_text(query.get('type', '')).lower()
+    if query_type in ('and', 'or'):
+        predicates = [compile_query(child) for child in query.get('filters', [])]
+        if query_type == 'and':
+            return lambda record: all(predicate(record) for predicate in predicates)
+        return lambda record: any(predicate(record) for predicate in predicates)
+    if query_type == 'not':
+        predicate = compile_query(query.get('filter'))
+        return lambda record: not predicate(record)
+    if query_type == 'ne':
+        predicate = _compile_eq(query['field'], query['value'])
+        return lambda record: not predicate(record)
+    if query_type in TETRATION_FIELD_OPERATORS:
+        if 'field' not in query or 'value' not in query:
+            raise ValueError('filter of type %s requires field and value' % query_type)
+        return TETRATION_FIELD_OPERATORS[query_type](query['field'], query['value'])
+    raise ValueError('unsupported filter type: %s' % query.get('type'))
+
+
+class InventorySnapshot(object):
+    ''' Locally cached inventory records with addresses pre-parsed once,
+    so compiled filters can be evaluated without contacting the cluster
+    '''
+    def __init__(self, records):
+        self.records = records
+        for record in self.records:
+            if 'ip' in record and TETRATION_IP_KEY not in record:
+                record[TETRATION_IP_KEY] = ip_to_int(record['ip'])
+
+    def __len__(self):
+        return len(self.records)
+
+    def match(self, query):
+        predicate = compile_query(query) if not callable(query) else query
+        return [record for record in self.records if predicate(record)]
+
+    def preview(self, filters, tree=None):
+        ''' Returns (matches, errors) for a list of inventory filters
+
+        matches maps each filter name to the records it selects. When a
+        ScopeTree is given, filters restricted to their scope are also
+        limited by the scope query, as the cluster does.
+        '''
+        matches = {}
+        errors = {}
+        for inventory_filter in filters:
+            name = inventory_filter.get('name')
+            query = inventory_filter.get('query') or inventory_filter.get('short_query')
+            scope = tree.get(inventory_filter.get('app_scope_id')) if tree else None
+            if scope and inventory_filter.get('restricted') and scope.get('query'):
+                query = dict(type='and', filters=[scope['query'], query])
+            try:
+                matches[name] = self.match(query)
+            except (ValueError, KeyError, TypeError, re.error) as exc:
+                errors[name] = to_text(exc)
+        return matches, errors
+
+    def dump(self):
+        ''' Returns the records without the pre-parsed addresses '''
+        return [dict((k, v) for k, v in record.items() if k != TETRATION_IP_KEY) for record in self.records]
@@ -0,0 +1,134 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# (c) 2018 Red Hat Inc.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import json
+import sqlite3
+from ansible.module_utils._text import to_text
+
+# inventory fields promoted to indexed columns; user annotations are the
+# fields prefixed with TETRATION_ANNOTATION_PREFIX (both are copied in the
+# tetration_inventory lookup plugin, keep them in step)
+TETRATION_MIRROR_COLUMNS = ['ip', 'host_name', 'vrf_id', 'vrf_name']
+TETRATION_ANNOTATION_PREFIX = 'user_'
+
+TETRATION_MIRROR_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hosts (
+    ip TEXT NOT NULL,
+    vrf_id TEXT NOT NULL DEFAULT '',
+    host_name TEXT,
+    vrf_name TEXT,
+    record TEXT NOT NULL,
+    PRIMARY KEY (ip, vrf_id)
+);
+CREATE INDEX IF NOT EXISTS hosts_host_name ON hosts (host_name);
+CREATE INDEX IF NOT EXISTS hosts_vrf_name ON hosts (vrf_name);
+CREATE TABLE IF NOT EXISTS annotations (
+    ip TEXT NOT NULL,
+    vrf_id TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (ip, vrf_id, name)
+);
+CREATE INDEX IF NOT EXISTS annotations_name_value ON annotations (name, value);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+class InventoryMirror(object):
+    ''' Local SQLite copy of the Tetration inventory
+
+    Hosts are keyed by address and VRF and indexed on hostname, VRF name
+    and user annotations. sync_state remembers how far the last sync got
+    so later runs only read what changed.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(TETRATION_MIRROR_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def get_state(self, key, default=None):
+        row = self.db.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def set_state(self, key, value):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def upsert(self, records):
+        ''' Writes a page of inventory records in one transaction '''
+        with self.db:
+            for record in records:
+                key = (to_text(record['ip']), to_text(record.get('vrf_id') or ''))
+                self.db.execute(
+                    'INSERT OR REPLACE INTO hosts (ip, vrf_id, host_name, vrf_name, record) VALUES (?, ?, ?, ?, ?)',
+                    key + (record.get('host_name'), record.get('vrf_name'), json.dumps(record))
+                )
+                self.db.execute('DELETE FROM annotations WHERE ip = ? AND vrf_id = ?', key)
+                self.db.executemany(
+                    'INSERT INTO annotations (ip, vrf_id, name, value) VALUES (?, ?, ?, ?)',
+                    [key + (name, to_text(value)) for name, value in record.items()
+                     if name.startswith(TETRATION_ANNOTATION_PREFIX) and value is not None]
+                )
+        return len(records)
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM hosts')
+            self.db.execute('DELETE FROM annotations')
+            self.db.execute('DELETE FROM sync_state')
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+
+    def query(self, **kwargs):
+        ''' Returns the records matching every given field, e.g.
+        query(ip='10.0.0.5') or query(vrf_name='Default', user_Pod='12')
+        '''
+        clauses = []
+        args = []
+        for field, value in kwargs.items():
+            if field in TETRATION_MIRROR_COLUMNS:
+                clauses.append('hosts.%s = ?' % field)
+                args.append(to_text(value))
+            elif field.startswith(TETRATION_ANNOTATION_PREFIX):
+                clauses.append('EXISTS (SELECT 1 FROM annotations a WHERE a.name = ? AND a.value = ? '
+                               'AND a.ip = hosts.ip AND a.vrf_id = hosts.vrf_id)')
+                args.extend([field, to_text(value)])
+            else:
+                raise ValueError('unsupported inventory field: %s' % field)
+        sql = 'SELECT record FROM hosts'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        return [json.loads(row['record']) for row in self.db.execute(sql, args)]
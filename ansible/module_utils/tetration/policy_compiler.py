@@ -0,0 +1,179 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# (c) 2018 Red Hat Inc.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import csv
+import os.path
+from ansible.module_utils._text import to_text
+from ansible.module_utils.six import integer_types, iteritems
+from ansible.module_utils.tetration.api import TETRATION_PROTOCOLS_BY_NAME, TETRATION_PROTOCOLS_BY_NUMBER
+
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
+
+# protocols whose policies carry port ranges
+TETRATION_PORT_PROTOCOLS = [6, 17]
+TETRATION_POLICY_ACTIONS = ['ALLOW', 'DENY']
+
+
+def resolve_protocol(protocol):
+    ''' Returns the protocol number for a name or number, '' for ANY
+
+    A blank protocol is refused rather than read as ANY, which would
+    absorb every port-scoped row of the same consumer and provider.
+    '''
+    if protocol is None or to_text(protocol).strip() == '':
+        raise ValueError('protocol is required, use ANY to allow every protocol')
+    if isinstance(protocol, integer_types) or to_text(protocol).strip().isdigit():
+        number = int(protocol)
+        if number not in TETRATION_PROTOCOLS_BY_NUMBER:
+            raise ValueError('unknown protocol number: %s' % protocol)
+        return number
+    name = to_text(protocol).strip().upper()
+    if name not in TETRATION_PROTOCOLS_BY_NAME:
+        raise ValueError('unknown protocol: %s' % protocol)
+    return TETRATION_PROTOCOLS_BY_NAME[name]
+
+
+def parse_ports(ports):
+    ''' Parses 80, "80,443", "8000-8100" or a list of those into ranges '''
+    if ports is None or ports == '':
+        return []
+    if isinstance(ports, (list, tuple)):
+        items = ports
+    else:
+        items = to_text(ports).replace(';', ',').split(',')
+    ranges = []
+    for item in items:
+        item = to_text(item).strip()
+        if not item:
+            continue
+        start, _, end = item.partition('-')
+        start = int(start)
+        end = int(end) if end else start
+        if not 0 <= start <= end <= 65535:
+            raise ValueError('invalid port range: %s' % item)
+        ranges.append((start, end))
+    return ranges
+
+
+def merge_ranges(ranges):
+    ''' Merges overlapping and adjacent (start, end) ranges '''
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def load_matrix(path):
+    ''' Reads a policy matrix from a CSV file with consumer, provider,
+    protocol and ports columns, or from a YAML list of the same keys
+    '''
+    if not os.path.exists(path):
+        raise ValueError('unable to find policy matrix: %s' % path)
+    with open(path) as matrix_file:
+        if path.lower().endswith('.csv'):
+            return [dict((k.strip(), v) for k, v in iteritems(row) if k) for row in csv.DictReader(matrix_file)]
+        if not HAS_YAML:
+            raise ValueError('PyYAML is required to read %s' % path)
+        matrix = yaml.safe_load(matrix_file) or []
+    return matrix.get('policies', []) if isinstance(matrix, dict) else matrix
+
+
+def compile_policies(rows, resolve_filter):
+    ''' Compiles policy matrix rows into the minimal list of policies
+
+    Rows sharing consumer, provider and action become one policy. Port
+    ranges are merged per protocol and any protocol absorbs the others.
+    resolve_filter maps a consumer or provider name to its filter id.
+    '''
+    groups = {}
+    order = []
+    for row in rows:
+        action = to_text(row.get('action') or 'ALLOW').upper()
+        if action not in TETRATION_POLICY_ACTIONS:
+            raise ValueError('invalid action: %s' % row.get('action'))
+        key = (resolve_filter(row['consumer']), resolve_filter(row['provider']), action)
+        if key not in groups:
+            groups[key] = {}
+            order.append(key)
+        protocol = resolve_protocol(row.get('protocol'))
+        ranges = parse_ports(row.get('ports', row.get('port')))
+        if ranges and protocol not in TETRATION_PORT_PROTOCOLS:
+            raise ValueError('ports are only allowed with TCP or UDP, not with protocol: %s' % row.get('protocol'))
+        protocols = groups[key]
+        if not ranges:
+            # every port of the protocol is allowed
+            protocols[protocol] = None
+        elif protocols.get(protocol, []) is not None:
+            protocols.setdefault(protocol, []).extend(ranges)
+    policies = []
+    for key in order:
+        consumer_id, provider_id, action = key
+        protocols = groups[key]
+        if '' in protocols:
+            protocols = {'': None}
+        l4_params = []
+        for protocol in sorted(protocols, key=to_text):
+            if protocol == '':
+                l4_params.append(dict())
+            elif protocols[protocol] is None:
+                l4_params.append(dict(proto=protocol))
+            else:
+                l4_params.extend(dict(proto=protocol, port=[start, end]) for start, end in merge_ranges(protocols[protocol]))
+        policies.append(dict(
+            consumer_filter_id=consumer_id,
+            provider_filter_id=provider_id,
+            action=action,
+            l4_params=l4_params
+        ))
+    return policies
+
+
+def normalize_policies(policies):
+    ''' Returns a comparable set of (consumer, provider, action, l4 params) '''
+    normalized = set()
+    for policy in policies:
+        for l4_param in policy.get('l4_params') or [dict()]:
+            port = l4_param.get('port')
+            # exports carry ANY as a null proto, compiled policies omit it;
+            # protocol 0 is a real protocol, so no "or ''"
+            proto = l4_param.get('proto')
+            normalized.add((
+                policy.get('consumer_filter_id'),
+                policy.get('provider_filter_id'),
+                to_text(policy.get('action')).upper(),
+                '' if proto is None else to_text(proto),
+                tuple(port) if port else None
+            ))
+    return normalized
@@ -0,0 +1,133 @@
+# This code is part of Ansible, but is an independent component.
+# This particular file snippet, and this file snippet only, is BSD licensed.
+# Modules you write using this snippet, which is embedded dynamically by Ansible
+# still belong to the author of the module, and may assign their own license
+# to the complete work.
+#
+# (c) 2018 Red Hat Inc.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#    * Redistributions of source code must retain the above copyright
+#      notice, this list of conditions and the following disclaimer.
+#    * Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation
+#      and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE
+# USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from collections import deque
+
+# separator used by Tetration between the levels of a scope's full name
+TETRATION_SCOPE_SEPARATOR = ':'
+
+
+class ScopeTree(object):
+    ''' Index of Tetration app scopes built from a single /app_scopes read
+
+    Maps full scope name and id to the scope object and every scope id to
+    the ids of its children, so name resolution and hierarchy walks are
+    dictionary lookups instead of repeated filter scans.
+    '''
+    def __init__(self, scopes=None):
+        self.by_name = {}
+        self.by_id = {}
+        self.children = {}
+        for scope in scopes or []:
+            self.add(scope)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def add(self, scope):
+        ''' Adds or replaces a scope, e.g. the response of a scope creation '''
+        if not scope.get('name'):
+            parent = self.by_id.get(scope.get('parent_app_scope_id'))
+            scope['name'] = TETRATION_SCOPE_SEPARATOR.join([parent['name'], scope['short_name']]) if parent else scope['short_name']
+        previous = self.by_id.get(scope['id'])
+        if previous and previous['name'] != scope['name']:
+            self.by_name.pop(previous['name'], None)
+        self.by_id[scope['id']] = scope
+        self.by_name[scope['name']] = scope
+        self.children.setdefault(scope['id'], [])
+        parent_id = scope.get('parent_app_scope_id')
+        if parent_id:
+            siblings = self.children.setdefault(parent_id, [])
+            if scope['id'] not in siblings:
+                siblings.append(scope['id'])
+        return scope
+
+    def remove(self, scope_id):
+        ''' Drops a scope and everything beneath it from the index '''
+        scope = self.by_id.get(scope_id)
+        if not scope:
+            return
+        for child in list(self.subtree(scope)):
+            self.by_id.pop(child['id'], None)
+            self.by_name.pop(child['name'], None)
+            self.children.pop(child['id'], None)
+        siblings = self.children.get(scope.get('parent_app_scope_id'))
+        if siblings and scope_id in siblings:
+            siblings.remove(scope_id)
+
+    def resolve(self, name):
+        ''' Returns the scope with the full name, e.g. Root:Siwapp:Pod12:App '''
+        return self.by_name.get(name)
+
+    def get(self, scope_id):
+        return self.by_id.get(scope_id)
+
+    def parent(self, scope):
+        return self.by_id.get(scope.get('parent_app_scope_id'))
+
+    def roots(self):
+        return [scope for scope in self.by_id.values() if not self.parent(scope)]
+
+    def get_children(self, scope):
+        return [self.by_id[child_id] for child_id in self.children.get(scope['id'], []) if child_id in self.by_id]
+
+    def ancestors(self, scope):
+        ''' Returns the scope followed by each of its parents up to the root '''
+        path = []
+        while scope:
+            path.append(scope)
+            scope = self.parent(scope)
+        return path
+
+    def subtree(self, scope):
+        ''' Yields the scope and all of its descendants, breadth first '''
+        queue = deque([scope])
+        while queue:
+            current = queue.popleft()
+            yield current
+            queue.extend(self.get_children(current))
+
+    def lowest_common_ancestor(self, scope1, scope2):
+        ''' Returns the deepest scope both scopes descend from, or None '''
+        seen = set(ancestor['id'] for ancestor in self.ancestors(scope1))
+        for ancestor in self.ancestors(scope2):
+            if ancestor['id'] in seen:
+                return ancestor
+        return None
+
+    def split_name(self, name):
+        ''' Splits a full name into its existing parent and missing levels '''
+        levels = name.split(TETRATION_SCOPE_SEPARATOR)
+        for depth in range(len(levels), 0, -1):
+            existing = self.by_name.get(TETRATION_SCOPE_SEPARATOR.join(levels[:depth]))
+            if existing:
+                return existing, levels[depth:]
+        return None, levels
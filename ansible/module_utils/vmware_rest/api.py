@@ -26,7 +26,11 @@
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import hashlib
 import os
+import re
+import tempfile
+import threading
 from functools import partial
 from ansible.module_utils._text import to_native
 from ansible.module_utils.six import iteritems, iterkeys
@@ -37,10 +41,11 @@ import json
 from urllib2 import quote
 from requests.packages.urllib3 import disable_warnings
 from requests import Session
+from requests.adapters import HTTPAdapter
+from multiprocessing.pool import ThreadPool
 from jinja2 import Environment, FileSystemLoader
-from base64 import b64encode
-from random import randint
-from time import sleep
+from time import sleep, time
+import fcntl
 
 
 # Disable SSL Warnings
@@ -64,13 +69,196 @@ VMWARE_PROVIDER_SPEC = {
     'silent_ssl_warnings': dict(type='bool', default=True),
     'timeout': dict(type='int', default=10),
     'max_retries': dict(type='int', default=3),
+    'workers': dict(type='int', default=8),
+    'rate': dict(type='float', default=10.0),
+    'burst': dict(type='int', default=20),
+    'state_dir': dict(type='path', default='~/.ansible/tmp/vmware_rest'),
+    'cache_ttl': dict(type='int', default=300),
 }
 
+VMWARE_SESSION_HEADER = 'vmware-api-session-id'
+# number of values sent in one filter.<name>.N query
+VMWARE_FILTER_CHUNK = 100
+
+
+def filter_params(filters):
+    ''' Builds the filter.<name>[.N] query parameters of a /rest listing '''
+    params = {}
+    for key, values in iteritems(filters):
+        if isinstance(values, (list, tuple)):
+            for index, value in enumerate(values, 1):
+                params['filter.%s.%d' % (key, index)] = value
+        elif values is not None:
+            params['filter.%s' % key] = values
+    return params
+
+
+class RateLimiter(object):
+    ''' Token bucket shared by every process on the controller
+
+    The bucket lives in a small JSON file guarded by flock, so concurrent
+    forks together admit at most rate calls per second (with bursts of up
+    to burst calls) and only wait when vCenter is actually busy.
+    '''
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path), 0o700)
+            except OSError:
+                pass
+
+    def acquire(self):
+        while True:
+            with open(self.path, 'a+') as state_file:
+                fcntl.flock(state_file, fcntl.LOCK_EX)
+                try:
+                    state_file.seek(0)
+                    try:
+                        state = json.loads(state_file.read())
+                    except ValueError:
+                        state = dict(tokens=self.burst, updated=time())
+                    now = time()
+                    tokens = min(self.burst, state['tokens'] + (now - state['updated']) * self.rate)
+                    wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+                    if not wait:
+                        tokens -= 1
+                    state_file.seek(0)
+                    state_file.truncate()
+                    state_file.write(json.dumps(dict(tokens=tokens, updated=now)))
+                finally:
+                    fcntl.flock(state_file, fcntl.LOCK_UN)
+            if not wait:
+                return
+            sleep(wait)
+
+
+class RateLimitedSession(Session):
+    ''' Session admitting every request through a RateLimiter
+
+    When reauth is set, a request rejected with 401 calls it once and is
+    sent again, so an expired vCenter session is replaced transparently.
+    Requests carrying explicit credentials (the login itself) are not retried,
+    and a reauth failing with ValueError returns the 401 to the caller.
+    '''
+    def __init__(self, limiter=None, reauth=None):
+        super(RateLimitedSession, self).__init__()
+        self.limiter = limiter
+        self.reauth = reauth
+        self.reauth_lock = threading.Lock()
+
+    def send_request(self, *args, **kwargs):
+        if self.limiter:
+            self.limiter.acquire()
+        return super(RateLimitedSession, self).request(*args, **kwargs)
+
+    def request(self, *args, **kwargs):
+        session_id = self.headers.get(VMWARE_SESSION_HEADER)
+        resp = self.send_request(*args, **kwargs)
+        if resp.status_code != 401 or self.reauth is None or 'auth' in kwargs:
+            return resp
+        with self.reauth_lock:
+            # another thread may already have replaced the session
+            if self.headers.get(VMWARE_SESSION_HEADER) == session_id:
+                try:
+                    self.reauth()
+                except ValueError:
+                    return resp
+        return self.send_request(*args, **kwargs)
+
+class VmwareVmIndex(object):
+    ''' Resolves vm names to vms (id, power state and host)
+
+    The vms are listed once per host, which also keeps every listing under
+    the /rest result cap, and persisted on disk for ttl seconds so later
+    tasks resolve names locally. A name missing from the index triggers a
+    single refresh. Folders, clusters and resource pools are given by name.
+    '''
+    def __init__(self, api, state_dir, ttl, folders=None, clusters=None, resource_pools=None):
+        self.api = api
+        self.ttl = int(ttl)
+        self.folders = sorted(folders or [])
+        self.clusters = sorted(clusters or [])
+        self.resource_pools = sorted(resource_pools or [])
+        key = json.dumps([api.uri, self.folders, self.clusters, self.resource_pools])
+        name = hashlib.sha1(to_text(key).encode('utf-8')).hexdigest()
+        self.path = os.path.join(os.path.expanduser(state_dir), 'vms-%s.json' % name)
+        self.vms = None
+        self.refreshed = False
+
+    def load(self):
+        if self.vms is not None:
+            return
+        try:
+            if self.ttl > 0 and time() - os.path.getmtime(self.path) <= self.ttl:
+                with open(self.path) as cache_file:
+                    self.vms = json.load(cache_file)
+                return
+        except (IOError, OSError, ValueError):
+            pass
+        self.refresh()
+
+    def refresh(self):
+        folders = self.api.find_ids('vcenter/folder', 'folder', self.folders, type='VIRTUAL_MACHINE')
+        clusters = self.api.find_ids('vcenter/cluster', 'cluster', self.clusters)
+        resource_pools = self.api.find_ids('vcenter/resource-pool', 'resource_pool', self.resource_pools)
+        self.vms = {}
+        for vm in self.api.list_vms_per_host(folders=folders, clusters=clusters, resource_pools=resource_pools):
+            self.vms.setdefault(vm['name'], []).append(vm)
+        self.refreshed = True
+        self.save()
+
+    def save(self):
+        if self.ttl <= 0:
+            return
+        try:
+            cache_dir = os.path.dirname(self.path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, 0o700)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(self.vms, tmp_file)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+    def is_current(self, vms):
+        ''' Whether the vms still exist under the same ids and names '''
+        listed = set()
+        for start in range(0, len(vms), VMWARE_FILTER_CHUNK):
+            ids = [vm['vm'] for vm in vms[start:start + VMWARE_FILTER_CHUNK]]
+            listed.update((vm['vm'], vm['name']) for vm in self.api.list_vms(vms=ids))
+        return listed == set((vm['vm'], vm['name']) for vm in vms)
+
+    def resolve(self, names):
+        ''' Returns the list of vms carrying each name, by name
+
+        Vms read from the disk cache are checked with one id-filtered
+        listing, so a vm deleted or recreated (new id) since the index was
+        saved triggers a refresh instead of resolving to a dead id.
+        '''
+        self.load()
+        if not self.refreshed:
+            cached = [vm for name in names for vm in self.vms.get(name, [])]
+            if any(name not in self.vms for name in names) or not self.is_current(cached):
+                self.refresh()
+        return dict((name, self.vms.get(name, [])) for name in names)
+
+    def all(self):
+        ''' Returns every indexed vm, possibly from the disk cache, call
+        refresh first when stale entries matter
+        '''
+        self.load()
+        return [vm for vms in self.vms.values() for vm in vms]
+
+
 class VmwareApiBase(object):
     ''' Base class for implementing Vmware API '''
     provider_spec = {'provider': dict(type='dict', options=VMWARE_PROVIDER_SPEC)}
 
-    def __init__(self, provider):
+    def __init__(self, provider, connect=True):
         if not set(provider.keys()).issubset(VMWARE_PROVIDER_SPEC.keys()):
             raise ValueError('invalid or unsupported keyword argument for connector')
         for key, value in iteritems(VMWARE_PROVIDER_SPEC):
@@ -87,11 +275,17 @@ class VmwareApiBase(object):
                 # if key is required but still not defined raise Exception
                 if key not in provider and 'required' in value and value['required']:
                     raise ValueError('option: %s is required' % key)
-        self.session = Session()
-        # self.module.fail_json(msg=json.dumps(os.environ))
-        auth_string = b64encode(b'%s:%s' % (provider['user'], provider['password']))
+        limiter = None
+        if provider['rate'] and float(provider['rate']) > 0:
+            limiter = RateLimiter(
+                os.path.join(os.path.expanduser(provider['state_dir']), 'ratelimit-%s.json' % provider['host']),
+                provider['rate'],
+                provider['burst']
+            )
+        self.session = RateLimitedSession(limiter)
+        self.workers = max(1, int(provider['workers']))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=self.workers))
         self.session.headers.update({
-            'Authorization': 'Basic %s' % auth_string,
             'Content-Type': "application/json",
         })
         self.session.verify = provider['verify']
@@ -99,8 +293,93 @@ class VmwareApiBase(object):
         self.session.timeout = provider['timeout']
         self.session.max_retries = provider['max_retries']
         self.uri = 'https://%s/rest/' % provider['host']
-        self.session.post(self.uri + 'com/vmware/cis/session')
-        del self.session.headers['Authorization']
+        self.credentials = (provider['user'], provider['password'])
+        self.session_path = os.path.join(
+            os.path.expanduser(provider['state_dir']),
+            'session-%s' % re.sub(r'[^\w.@-]', '_', '%s-%s' % (provider['host'], provider['user']))
+        )
+        self.session.reauth = self.login
+        if connect:
+            self.resume()
+        else:
+            # only the cached id, e.g. to delete the session
+            session_id = self.read_session()
+            if session_id:
+                self.session.headers[VMWARE_SESSION_HEADER] = session_id
+
+    def read_session(self):
+        try:
+            with open(self.session_path) as session_file:
+                return session_file.read().strip() or None
+        except IOError:
+            return None
+
+    def resume(self):
+        ''' Reuses the session id cached by a previous task
+
+        A rejected id is answered with 401, which makes the session log in
+        again through the reauth hook.
+        '''
+        session_id = self.read_session()
+        if not session_id:
+            return self.login()
+        self.session.headers[VMWARE_SESSION_HEADER] = session_id
+        resp = self.session.post(self.uri + 'com/vmware/cis/session?~action=get')
+        if resp.status_code != 200:
+            raise ValueError('Unable to open a vCenter session: %s' % resp.text)
+
+    def login(self):
+        ''' Creates a vCenter session and caches its id for later tasks
+
+        Forks logging in at the same time are serialized with a flock, and
+        a fork finding an id cached meanwhile by another one adopts it
+        instead of opening a session of its own. Raises ValueError when
+        vCenter rejects the credentials.
+        '''
+        rejected = self.session.headers.pop(VMWARE_SESSION_HEADER, None)
+        session_dir = os.path.dirname(self.session_path)
+        if not os.path.isdir(session_dir):
+            try:
+                os.makedirs(session_dir, 0o700)
+            except OSError:
+                pass
+        with open(self.session_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                session_id = self.read_session()
+                if session_id and session_id != rejected:
+                    self.session.headers[VMWARE_SESSION_HEADER] = session_id
+                    return
+                resp = self.session.post(self.uri + 'com/vmware/cis/session', auth=self.credentials)
+                if resp.status_code != 200:
+                    raise ValueError('Unable to open a vCenter session: %s' % resp.text)
+                self.session.headers[VMWARE_SESSION_HEADER] = resp.json()['value']
+                self.save_session()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save_session(self):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.session_path))
+        with os.fdopen(fd, 'w') as session_file:
+            session_file.write(self.session.headers[VMWARE_SESSION_HEADER])
+        os.rename(tmp_path, self.session_path)
+
+    def logout(self):
+        ''' Deletes the vCenter session and its cached id
+
+        Returns whether there was a session to delete.
+        '''
+        if VMWARE_SESSION_HEADER not in self.session.headers:
+            return False
+        # an expired session must not be replaced just to be deleted
+        self.session.reauth = None
+        resp = self.session.delete(self.uri + 'com/vmware/cis/session')
+        del self.session.headers[VMWARE_SESSION_HEADER]
+        try:
+            os.remove(self.session_path)
+        except OSError:
+            pass
+        return resp.status_code == 200
 
     def handle_exception(self, method_name, exc, task):
         ''' Handles any exceptions raised
@@ -118,38 +397,82 @@ class VmwareApiBase(object):
 
 class VmwareApiModule(VmwareApiBase):
     ''' Implements Vmware API for executing a vmware module '''
-    def __init__(self, module):
+    def __init__(self, module, connect=True):
         self.module = module
+        # tags and categories are read once per run
+        self.categories = None
+        self.tags = None
+        self.tags_by_id = {}
+        self.tags_by_name = {}
         provider = module.params.get('provider') if module.params.get('provider') else dict()
         try:
-            super(VmwareApiModule, self).__init__(provider)
-            sleep(randint(2,10))
+            super(VmwareApiModule, self).__init__(provider, connect)
         except Exception as exc:
             self.module.fail_json(msg=to_text(exc))
+        self.state_dir = provider['state_dir']
+        self.cache_ttl = provider['cache_ttl']
+        self.vm_index = self.get_vm_index()
+
+    def get_vm_index(self, folders=None, clusters=None, resource_pools=None):
+        ''' Returns an index of the vms, restricted to the named folders,
+        clusters or resource pools
+        '''
+        return VmwareVmIndex(self, self.state_dir, self.cache_ttl, folders, clusters, resource_pools)
+
+    def get_many(self, queries, task):
+        ''' Sends the (path, params) GET queries concurrently and returns
+        the value of each response
+        '''
+        if not queries:
+            return []
+
+        def fetch(query):
+            return self.session.get(self.uri + query[0], params=query[1])
+
+        pool = ThreadPool(min(self.workers, len(queries)))
+        try:
+            responses = pool.map(fetch, queries)
+        finally:
+            pool.close()
+            pool.join()
+        values = []
+        for resp in responses:
+            if resp.status_code != 200:
+                self.handle_exception('get', resp, task)
+            values.append(resp.json().get('value'))
+        return values
+
+    def get_details(self, path, task):
+        ''' Lists the ids under path and fetches every object concurrently '''
+        resp = self.session.get(self.uri + path)
+        if resp.status_code != 200:
+            self.handle_exception('get', resp, task)
+        ids = resp.json().get('value', [])
+        return self.get_many([(path + '/id:' + id, None) for id in ids], task)
 
     def get_categories(self):
-        categories = []
-        category_ids = self.session.get(self.uri + 'com/vmware/cis/tagging/category')
-        if category_ids.status_code != 200:
-            self.handle_exception('get',resp)
-        if 'value' not in category_ids.json():
-            return categories
-        for id in category_ids.json()['value']:
-            category = self.session.get(self.uri + 'com/vmware/cis/tagging/category/id:' + id)
-            categories.append(category.json()['value'])
-        return categories
+        if self.categories is None:
+            self.categories = self.get_details('com/vmware/cis/tagging/category', 'get_categories')
+        return self.categories
 
     def get_tags(self):
-        tags = []
-        tag_ids = self.session.get(self.uri + 'com/vmware/cis/tagging/tag')
-        if tag_ids.status_code != 200:
-            self.handle_exception('get', tag_ids, 'get_tags')
-        if 'value' not in tag_ids.json():
-            return tags
-        for id in tag_ids.json()['value']:
-            tag = self.session.get(self.uri + 'com/vmware/cis/tagging/tag/id:' + id)
-            tags.append(tag.json()['value'])
-        return tags
+        if self.tags is None:
+            self.tags = self.get_details('com/vmware/cis/tagging/tag', 'get_tags')
+            self.index_tags()
+        return self.tags
+
+    def index_tags(self):
+        self.tags_by_id = dict((tag['id'], tag) for tag in self.tags)
+        self.tags_by_name = {}
+        for tag in self.tags:
+            self.tags_by_name.setdefault(tag['name'], []).append(tag)
+
+    def get_tag(self, name, category_id=None):
+        ''' Returns the tag with the name, within the category if given '''
+        self.get_tags()
+        matches = [tag for tag in self.tags_by_name.get(name, [])
+                   if category_id is None or tag['category_id'] == category_id]
+        return matches[0] if len(matches) == 1 else None
 
     def create_tag(self, category, description, name):
         req_payload = dict(
@@ -164,12 +487,16 @@ class VmwareApiModule(VmwareApiBase):
             return None
         elif resp.status_code != 200:
             self.handle_exception('post', resp, 'create_tag')
-        return dict(
+        tag = dict(
             category_id = category['id'],
             description = description,
             name = name,
             id = resp.json()['value']
         )
+        if self.tags is not None:
+            self.tags.append(tag)
+            self.index_tags()
+        return tag
     
     def attach_tags(self, object, tags):
         req_payload = dict(
@@ -195,22 +522,96 @@ class VmwareApiModule(VmwareApiBase):
         resp = self.session.post(self.uri + 'com/vmware/cis/tagging/tag-association?~action=detach-multiple-tags-from-object', data=json.dumps(req_payload))
         if resp.status_code != 200:
             self.handle_exception('post', resp, 'detach_tags')
-    
+
+    def tag_objects(self, action, tag, vm_ids, task):
+        req_payload = dict(
+            object_ids = [dict(id = vm_id, type = 'VirtualMachine') for vm_id in vm_ids]
+        )
+        resp = self.session.post(self.uri + 'com/vmware/cis/tagging/tag-association/id:%s?~action=%s' % (tag['id'], action), data=json.dumps(req_payload))
+        if resp.status_code != 200:
+            self.handle_exception('post', resp, task)
+        # the batch actions report per object failures in the body
+        result = resp.json().get('value') if resp.text else None
+        if isinstance(result, dict) and not result.get('success', True):
+            self.module.fail_json(
+                msg='Unable to %s tag %s' % (action, tag['name']),
+                errors=result.get('error_messages', []),
+                task=task
+            )
+
+    def attach_tag_to_objects(self, tag, vm_ids):
+        self.tag_objects('attach-tag-to-multiple-objects', tag, vm_ids, 'attach_tag_to_objects')
+
+    def detach_tag_from_objects(self, tag, vm_ids):
+        self.tag_objects('detach-tag-from-multiple-objects', tag, vm_ids, 'detach_tag_from_objects')
+
+    def get_attached_objects_on_tags(self, tags):
+        ''' Returns the ids of the vms attached to each tag, by tag id '''
+        attached = dict((tag['id'], set()) for tag in tags)
+        if not tags:
+            return attached
+        req_payload = dict(
+            tag_ids = [tag['id'] for tag in tags]
+        )
+        resp = self.session.post(self.uri + 'com/vmware/cis/tagging/tag-association?~action=list-attached-objects-on-tags', data=json.dumps(req_payload))
+        if resp.status_code != 200:
+            self.handle_exception('get', resp, 'get_attached_objects_on_tags')
+        for association in resp.json().get('value', []):
+            attached[association['tag_id']].update(
+                object['id'] for object in association['object_ids'] if object['type'] == 'VirtualMachine'
+            )
+        return attached
+
     def delete_tag(self, tag):
         resp = self.session.delete(self.uri + 'com/vmware/cis/tagging/tag/id:%s' % tag['id'])
         if resp.status_code != 200:
             self.handle_exception('delete', resp, 'delete_tag')
+        if self.tags is not None:
+            self.tags = [cached for cached in self.tags if cached['id'] != tag['id']]
+            self.index_tags()
 
-    def get_vm_by_name(self, name):
-        resp = self.session.get(self.uri + 'vcenter/vm?filter.names.1=%s' % name)
+    def find_ids(self, path, key, names, **filters):
+        ''' Returns the ids of the named objects listed under path '''
+        if not names:
+            return []
+        resp = self.session.get(self.uri + path, params=filter_params(dict(filters, names=names)))
+        if resp.status_code != 200:
+            self.handle_exception('get', resp, 'find_ids')
+        objects = resp.json().get('value', [])
+        missing = set(names) - set(obj['name'] for obj in objects)
+        if missing:
+            self.module.fail_json(msg='Unable to find %s named: %s' % (key, ', '.join(sorted(missing))))
+        return [obj[key] for obj in objects]
+
+    def list_vms(self, **filters):
+        ''' Lists vms matching the filters, e.g. names=[...] or folders=[...] '''
+        resp = self.session.get(self.uri + 'vcenter/vm', params=filter_params(filters))
+        if resp.status_code != 200:
+            self.handle_exception('get', resp, 'list_vms')
+        return resp.json().get('value', [])
+
+    def list_vms_per_host(self, folders=None, clusters=None, resource_pools=None):
+        ''' Lists the vms of every host concurrently, adding the host to each vm '''
+        resp = self.session.get(self.uri + 'vcenter/host', params=filter_params(dict(clusters=clusters)))
         if resp.status_code != 200:
-            self.handle_exception('get', resp, 'get_vm_by_name')
-        elif 'value' not in resp.json():
+            self.handle_exception('get', resp, 'list_vms_per_host')
+        hosts = resp.json().get('value', [])
+        queries = [('vcenter/vm', filter_params(dict(hosts=[host['host']], folders=folders, resource_pools=resource_pools))) for host in hosts]
+        vms = []
+        for host, host_vms in zip(hosts, self.get_many(queries, 'list_vms_per_host')):
+            for vm in host_vms or []:
+                vm['host'] = host['name']
+                vm['host_id'] = host['host']
+                vms.append(vm)
+        return vms
+
+    def get_vm_by_name(self, name):
+        vms = self.vm_index.resolve([name])[name]
+        if not vms:
             self.module.fail_json(msg='Unable to find vm named: %s' % name)
-        elif len(resp.json()['value']) > 1:
+        elif len(vms) > 1:
             self.module.fail_json(msg='Multiple matches found for vm name: %s' % name)
-        else:
-            return resp.json()['value'][0]
+        return vms[0]
 
     def get_attached_tags(self, vm):
         req_payload = dict(
@@ -223,3 +624,18 @@ class VmwareApiModule(VmwareApiBase):
         if resp.status_code != 200:
             self.handle_exception('get', resp, 'get_attached_tags')
         return resp.json()['value'] if 'value' in resp.json() else []
+
+    def get_attached_tags_on_objects(self, vm_ids):
+        ''' Returns the ids of the tags attached to each vm, by vm id '''
+        attached = dict((vm_id, set()) for vm_id in vm_ids)
+        if not vm_ids:
+            return attached
+        req_payload = dict(
+            object_ids = [dict(id = vm_id, type = 'VirtualMachine') for vm_id in vm_ids]
+        )
+        resp = self.session.post(self.uri + 'com/vmware/cis/tagging/tag-association?~action=list-attached-tags-on-objects', data=json.dumps(req_payload))
+        if resp.status_code != 200:
+            self.handle_exception('get', resp, 'get_attached_tags_on_objects')
+        for association in resp.json().get('value', []):
+            attached.setdefault(association['object_id']['id'], set()).update(association['tag_ids'])
+        return attached